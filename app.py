@@ -1,6 +1,9 @@
 import streamlit as st
 import asyncio
-from src.search_orchestrator import SearchOrchestrator
+import queue
+import threading
+# The search stack is imported when the first query needs it, so the page renders at once
+from src.startup import get_search_orchestrator
 import os
 from dotenv import load_dotenv
 
@@ -12,10 +15,6 @@ if not os.getenv('GROQ_API_KEY'):
     st.error("GROQ_API_KEY is not set in .env file")
     st.stop()
 
-# Initialize session state
-if 'search_orchestrator' not in st.session_state:
-    st.session_state.search_orchestrator = SearchOrchestrator()
-
 # Page configuration
 st.set_page_config(
     page_title="DocsGPT - Documentation Search",
@@ -46,33 +45,74 @@ with col1:
         key="search_input"
     )
 
+@st.cache_resource
+def search_loop():
+    """
+    One event loop per server process running every session's searches, so
+    loop-bound state (HTTP pools, semaphores) is built once and reused
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="search-loop", daemon=True).start()
+    return loop
+
+_END = object()
+
+def stream_events(events):
+    """Relay an async event stream running on the search loop to Streamlit's synchronous script"""
+    relay = queue.Queue()
+
+    async def pump():
+        try:
+            async for event in events:
+                relay.put(event)
+        finally:
+            await events.aclose()
+            relay.put(_END)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), search_loop())
+    try:
+        while (event := relay.get()) is not _END:
+            yield event
+        future.result()
+    finally:
+        # Stops the search if the session goes away mid-answer
+        future.cancel()
+
+def answer_tokens(query, sources):
+    """Yield answer tokens, collecting the sources as they arrive"""
+    events = st.session_state.search_orchestrator.search_stream(query)
+    for event in stream_events(events):
+        if event["type"] == "sources":
+            sources.extend(event["sources"])
+        elif event["type"] == "token":
+            yield event["content"]
+        elif event["type"] == "job":
+            st.info(f"Indexing new documentation in the background (job {event['job_id']})")
+        elif event["type"] == "error":
+            st.error(f"Search error: {event['detail']}")
+
 if query:
     try:
         with st.status("🔍 Searching...", expanded=True) as status:
-            async def search_and_display():
-                try:
-                    results = await st.session_state.search_orchestrator.search(query)
-                    return results
-                except Exception as e:
-                    st.error(f"Search error: {str(e)}")
-                    return None
+            if 'search_orchestrator' not in st.session_state:
+                # Built once per server process and shared by every session
+                status.update(label="⏳ Loading search components...")
+                st.session_state.search_orchestrator = get_search_orchestrator()
+                status.update(label="🔍 Searching...")
+            sources = []
             
-            # Run search
-            results = asyncio.run(search_and_display())
+            # Render the answer progressively as tokens arrive
+            with st.expander("📖 Answer", expanded=True):
+                answer = st.write_stream(answer_tokens(query, sources))
+                
+                if answer and sources:
+                    st.markdown("---")
+                    st.markdown("**Sources:**")
+                    for source in sources:
+                        st.markdown(f"- [{source}]({source})")
             
-            if results:
+            if answer:
                 status.update(label="✅ Results Found", state="complete")
-                
-                # Display results with improved formatting
-                for result in results:
-                    with st.expander("📖 Answer", expanded=True):
-                        st.markdown(result['explanation'])
-                        
-                        if result.get('sources'):
-                            st.markdown("---")
-                            st.markdown("**Sources:**")
-                            for source in result['sources']:
-                                st.markdown(f"- [{source}]({source})")
             else:
                 status.update(label="⚠️ No Results", state="error")
                 st.warning("""
@@ -0,0 +1 @@
+"""Offline benchmarks and load tests; see benchmarks/README.md"""
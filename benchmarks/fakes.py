@@ -0,0 +1,151 @@
+"""Offline stand-ins for the web so benchmarks need no network access.
+
+The LLM and embedding model are replaced by the providers' built-in local
+modes (``LLM_PROVIDER=local``, ``EMBEDDING_PROVIDER=local``); Google search and
+page fetching by ``FakeURLSearch`` and ``FakeFetcher``. Synthetic pages are
+written in a made-up vocabulary grouped into topics, so a query built from a
+topic's words retrieves that topic's chunks, while words outside the lexicon
+retrieve nothing and take the ingestion path.
+"""
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do", "fi", "gu", "ha", "je", "xo")
+TOPICS = 500
+WORDS_PER_TOPIC = 8
+FILLER_WORDS = ("the", "a", "with", "for", "when", "uses", "returns", "calls", "of", "in", "and", "to")
+
+
+def _word(index: int) -> str:
+    syllables = []
+    for _ in range(4):
+        index, syllable = divmod(index, len(SYLLABLES))
+        syllables.append(SYLLABLES[syllable])
+    return "".join(syllables)
+
+
+def topic_words(topic: int) -> List[str]:
+    """The words a topic's pages are written in"""
+    return [_word(topic * WORDS_PER_TOPIC + i) for i in range(WORDS_PER_TOPIC)]
+
+
+def synthetic_text(topic: int, rng: random.Random, words: int = 150) -> str:
+    """Sentences mostly in the topic's vocabulary, roughly the length of a chunk at 150 words"""
+    vocabulary = topic_words(topic)
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 16))
+        sentence = [rng.choice(vocabulary) if rng.random() < 0.9 else rng.choice(FILLER_WORDS)
+                    for _ in range(length)]
+        sentences.append(" ".join(sentence).capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+def synthetic_chunks(count: int, seed: int = 0) -> List[Dict]:
+    """``count`` chunk records ({"content", "metadata"}) spread over all topics"""
+    rng = random.Random(seed)
+    return [
+        {
+            "content": synthetic_text(i % TOPICS, rng),
+            "metadata": {"source": f"https://docs.example.com/topic-{i % TOPICS}/page-{i // TOPICS}", "topic": i % TOPICS}
+        }
+        for i in range(count)
+    ]
+
+
+def topic_query(topic: int, rng: random.Random, words: int = 6) -> str:
+    return " ".join(rng.sample(topic_words(topic), words))
+
+
+def unknown_query(rng: random.Random, words: int = 6) -> str:
+    """A query in words no synthetic page uses, so retrieval finds nothing"""
+    return " ".join(f"zy{rng.randrange(10 ** 6)}q" for _ in range(words))
+
+
+def synthetic_page(url: str, paragraphs: int = 12) -> str:
+    """An HTML documentation page whose content is determined by its URL"""
+    seed = int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "little")
+    rng = random.Random(seed)
+    topic = seed % TOPICS
+    body = "\n".join(f"<p>{synthetic_text(topic, rng, words=rng.randint(60, 200))}</p>" for _ in range(paragraphs))
+    return (
+        f'<html lang="en"><head><title>Topic {topic} guide</title>'
+        f'<meta name="description" content="Synthetic documentation for topic {topic}"></head>'
+        f"<body><h1>Topic {topic}</h1>\n{body}\n</body></html>"
+    )
+
+
+class FakeFetcher:
+    """Drop-in for AsyncFetcher serving synthetic pages after ``latency`` seconds"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return {"url": url, "status": 200, "text": synthetic_page(url), "headers": {}}
+
+    async def aclose(self):
+        pass
+
+
+class FakeURLSearch:
+    """Stand-in for Google search returning synthetic URLs derived from the query"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def __call__(self, query: str, num_results: int) -> List[str]:
+        time.sleep(self.latency)
+        slug = hashlib.blake2b(query.encode(), digest_size=6).hexdigest()
+        return [f"https://docs.example.com/search-{slug}/result-{i}" for i in range(num_results)]
+
+
+def offline_environment(path: str, llm_latency_ms: float = 0, embedding_latency_ms: float = 0):
+    """
+    Point every component at local providers and an index at ``path``. Call
+    before importing anything from ``src``, which reads its settings at import
+    """
+    os.environ.update({
+        "VECTOR_STORE_PATH": path,
+        "LLM_PROVIDER": "local",
+        "EMBEDDING_PROVIDER": "local",
+        "LOCAL_LLM_LATENCY_MS": str(llm_latency_ms),
+        "LOCAL_EMBEDDING_LATENCY_MS": str(embedding_latency_ms),
+        "SHARED_EMBEDDINGS": "false",
+    })
+    for name, value in (("GROQ_API_KEY", "offline"), ("MODEL_NAME", "local"),
+                        ("SUMMARY_MODEL", "local"), ("SUMMARY_TEMPERATURE", "0")):
+        os.environ.setdefault(name, value)
+
+
+def build_orchestrator(fetch_latency: float = 0.0, search_latency: float = 0.0):
+    """SearchOrchestrator wired to the fake web; requires ``offline_environment`` first"""
+    from src.search_orchestrator import SearchOrchestrator
+    return SearchOrchestrator(fetcher=FakeFetcher(fetch_latency), url_search=FakeURLSearch(search_latency))
+
+
+def seed_index(content_ingestion, chunks: int, seed: int = 0, batch_size: int = 10000):
+    """Fill the pipeline's index with ``chunks`` synthetic chunks, unless it already has them"""
+    from src.content_ingestion import VECTOR_STORE_PATH
+    from src.vector_store import SegmentedVectorStore
+    store = content_ingestion.vector_store
+    if store is not None and store.ntotal >= chunks:
+        return
+    if store is None:
+        store = content_ingestion.vector_store = SegmentedVectorStore(content_ingestion.embeddings, VECTOR_STORE_PATH)
+        content_ingestion.embeddings.save_index_metadata(VECTOR_STORE_PATH)
+    records = synthetic_chunks(chunks, seed)[store.ntotal:]
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        texts = [record["content"] for record in batch]
+        store.add_embeddings(texts, content_ingestion.embeddings.embed_documents(texts),
+                             [record["metadata"] for record in batch])
+    content_ingestion.index_version += 1
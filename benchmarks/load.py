@@ -0,0 +1,150 @@
+"""Concurrent load test of the search API with latency percentiles.
+
+    python -m benchmarks.load --requests 500 --concurrency 32
+    python -m benchmarks.load --endpoint /api/search/stream --llm-latency-ms 800
+    python -m benchmarks.load --url http://localhost:8000 --requests 200
+
+Without ``--url`` the FastAPI app runs in this process against the local LLM
+and embedding providers, the fake web from ``benchmarks.fakes`` and an index
+seeded with ``--chunks`` synthetic chunks, so results are reproducible
+offline. Queries mix repeats (answer cache hits), fresh queries answered
+from the index and unknown queries that go through ingestion. Per-stage
+timings are read back from /api/metrics.
+"""
+from typing import Dict, List, Tuple
+import argparse
+import asyncio
+import random
+import re
+import shutil
+import tempfile
+import time
+import warnings
+import httpx
+from .fakes import TOPICS, build_orchestrator, offline_environment, seed_index, topic_query, unknown_query
+from .report import latency_summary, print_table, write_json
+
+_STAGE_SAMPLE = re.compile(r'^docsgpt_stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+
+def build_queries(count: int, repeat_ratio: float, miss_ratio: float, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    hot = [topic_query(rng.randrange(TOPICS), rng) for _ in range(20)]
+    queries = []
+    for _ in range(count):
+        draw = rng.random()
+        if draw < miss_ratio:
+            queries.append(unknown_query(rng))
+        elif draw < miss_ratio + repeat_ratio:
+            queries.append(rng.choice(hot))
+        else:
+            queries.append(topic_query(rng.randrange(TOPICS), rng))
+    return queries
+
+
+async def run_load(client: httpx.AsyncClient,
+                   endpoint: str,
+                   queries: List[str],
+                   concurrency: int) -> Tuple[List[float], Dict[str, int], float]:
+    """Latency of each request in ms, counts per status code and the wall time in seconds"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def one(query: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                # Read the whole body so streamed answers are timed to their end
+                response = await client.post(endpoint, json={"query": query})
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def stage_rows(metrics_text: str) -> List[Dict]:
+    """Count and mean duration of each stage from the Prometheus metrics"""
+    stages: Dict[str, Dict[str, float]] = {}
+    for kind, stage, value in _STAGE_SAMPLE.findall(metrics_text):
+        stages.setdefault(stage, {})[kind] = float(value)
+    return [
+        {"stage": stage, "count": int(values.get("count", 0)),
+         "mean_ms": round(values.get("sum", 0) / values["count"] * 1000, 3) if values.get("count") else 0.0}
+        for stage, values in sorted(stages.items())
+    ]
+
+
+def in_process_client(args: argparse.Namespace, path: str) -> httpx.AsyncClient:
+    offline_environment(path, llm_latency_ms=args.llm_latency_ms, embedding_latency_ms=args.embedding_latency_ms)
+    import main
+    from src.startup import set_search_orchestrator
+    orchestrator = build_orchestrator(args.fetch_latency_ms / 1000, args.search_latency_ms / 1000)
+    seed_index(orchestrator.content_ingestion, args.chunks)
+    set_search_orchestrator(orchestrator)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark", timeout=None)
+
+
+async def benchmark(args: argparse.Namespace, path: str) -> Tuple[Dict, List[Dict]]:
+    client = (
+        httpx.AsyncClient(base_url=args.url, timeout=None) if args.url else in_process_client(args, path)
+    )
+    async with client:
+        queries = build_queries(args.requests, args.repeat_ratio, args.miss_ratio, args.seed)
+        if args.warm_up:
+            await run_load(client, args.endpoint, queries[:args.warm_up], args.concurrency)
+        latencies, statuses, seconds = await run_load(client, args.endpoint, queries, args.concurrency)
+        metrics = await client.get("/api/metrics")
+    summary = {
+        "endpoint": args.endpoint,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(args.requests / seconds, 1),
+        "statuses": " ".join(f"{status}:{count}" for status, count in sorted(statuses.items())),
+        **latency_summary(latencies)
+    }
+    return summary, stage_rows(metrics.text) if metrics.status_code == 200 else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Load a running server instead of an in-process app")
+    parser.add_argument("--endpoint", default="/api/search", choices=("/api/search", "/api/search/stream"))
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warm-up", type=int, default=0, help="Requests sent before measuring")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="Share of repeated (cacheable) queries")
+    parser.add_argument("--miss-ratio", type=float, default=0.05, help="Share of queries the index cannot answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunks", type=int, default=10000, help="Synthetic chunks seeded into the index")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--embedding-latency-ms", type=float, default=5)
+    parser.add_argument("--fetch-latency-ms", type=float, default=100)
+    parser.add_argument("--search-latency-ms", type=float, default=200)
+    parser.add_argument("--path", default=None, help="Index directory for the in-process app (default: a temp dir)")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+    # LangChain warns on every below-threshold retrieval, which misses do by design
+    warnings.filterwarnings("ignore", message="(Relevance scores must be|No relevant docs were retrieved)")
+
+    root = args.path or tempfile.mkdtemp(prefix="docsgpt-load-")
+    try:
+        summary, stages = asyncio.run(benchmark(args, root))
+    finally:
+        if not args.path and not args.url:
+            shutil.rmtree(root, ignore_errors=True)
+    print_table([summary])
+    if stages:
+        print()
+        print_table(stages)
+    write_json([summary, *stages], args.json)
+
+
+if __name__ == "__main__":
+    # Ingestion's spawned chunking workers re-import this module
+    main()
@@ -0,0 +1,205 @@
+"""Microbenchmarks of the ingestion and retrieval building blocks, fully offline.
+
+    python -m benchmarks.micro
+    python -m benchmarks.micro --only index --sizes 10000,100000 --index-type hnsw
+    python -m benchmarks.micro --json baseline.json
+
+Embedding uses the local provider unless EMBEDDING_PROVIDER says otherwise, so
+it measures the service's batching overhead rather than a model. Index
+benchmarks use random unit vectors; at 1M chunks and 768 dimensions expect
+about 3 GB of memory and disk.
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .fakes import TOPICS, offline_environment, synthetic_chunks, synthetic_page, topic_query
+from .report import latency_summary, print_table, write_json
+
+BENCHMARKS = ("embedding", "chunking", "index")
+
+
+def _disk_mb(path: str) -> float:
+    total = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+    return round(total / 1024 / 1024, 1)
+
+
+def bench_embedding(texts: int, concurrency: int) -> List[Dict]:
+    from src.embedding_service import EmbeddingService
+    service = EmbeddingService()
+    service.warm_up()
+    documents = [chunk["content"] for chunk in synthetic_chunks(texts)]
+
+    start = time.perf_counter()
+    service.embed_documents(documents)
+    batch_seconds = time.perf_counter() - start
+
+    # Single-query calls from many threads, as concurrent searches issue them
+    rng = random.Random(0)
+    queries = [topic_query(rng.randrange(TOPICS), rng) for _ in range(texts)]
+
+    def timed(query: str) -> float:
+        start = time.perf_counter()
+        service.embed_query(query)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(timed, queries))
+    concurrent_seconds = time.perf_counter() - start
+    return [
+        {"benchmark": "embed_documents", "size": texts, "seconds": round(batch_seconds, 3),
+         "per_second": round(texts / batch_seconds)},
+        {"benchmark": f"embed_query x{concurrency} threads", "size": texts,
+         "seconds": round(concurrent_seconds, 3), "per_second": round(texts / concurrent_seconds),
+         **latency_summary(latencies)}
+    ]
+
+
+def bench_chunking(pages: int) -> List[Dict]:
+    from src.text_processing import aparse_and_chunk, get_process_pool, parse_and_chunk
+    documents = [(synthetic_page(f"https://docs.example.com/bench/{i}"), f"https://docs.example.com/bench/{i}")
+                 for i in range(pages)]
+
+    start = time.perf_counter()
+    chunks = sum(len(parse_and_chunk(html, url)) for html, url in documents)
+    serial_seconds = time.perf_counter() - start
+
+    async def parallel():
+        return await asyncio.gather(*(aparse_and_chunk(html, url) for html, url in documents))
+
+    # Start the pool's workers first so their spawn cost is not counted
+    asyncio.run(aparse_and_chunk(*documents[0]))
+    start = time.perf_counter()
+    asyncio.run(parallel())
+    parallel_seconds = time.perf_counter() - start
+    get_process_pool().shutdown()
+    return [
+        {"benchmark": "parse_and_chunk", "size": pages, "chunks": chunks,
+         "seconds": round(serial_seconds, 3), "per_second": round(pages / serial_seconds, 1)},
+        {"benchmark": "aparse_and_chunk (process pool)", "size": pages, "chunks": chunks,
+         "seconds": round(parallel_seconds, 3), "per_second": round(pages / parallel_seconds, 1)}
+    ]
+
+
+def _search_latencies(store, queries: np.ndarray, k: int) -> List[float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.similarity_search_with_score_by_vector(query.tolist(), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def bench_index(size: int, dim: int, batch_size: int, queries: int, k: int, index_type: str, path: str) -> List[Dict]:
+    """Add ``size`` vectors in batches, search, compact (persist plus ANN build), search and reload"""
+    from src.ann_index import IndexConfig
+    from src.embedding_service import LocalEmbeddings
+    from src.vector_store import SegmentedVectorStore
+    embedding = LocalEmbeddings(dimension=dim)
+    index_config = IndexConfig(index_type=index_type)
+    store = SegmentedVectorStore(embedding, path, index_config)
+    rng = np.random.default_rng(size)
+
+    def unit_vectors(count: int) -> np.ndarray:
+        vectors = rng.standard_normal((count, dim), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    add_seconds = 0.0
+    for start in range(0, size, batch_size):
+        count = min(batch_size, size - start)
+        texts = [f"benchmark chunk {i}" for i in range(start, start + count)]
+        metadatas = [{"source": f"https://docs.example.com/page-{i // 20}"} for i in range(start, start + count)]
+        vectors = unit_vectors(count)
+        started = time.perf_counter()
+        store.add_embeddings(texts, vectors, metadatas)
+        add_seconds += time.perf_counter() - started
+    query_vectors = unit_vectors(queries)
+    rows = [{"benchmark": "index add", "size": size, "seconds": round(add_seconds, 3),
+             "per_second": round(size / add_seconds), "segments": len(store.segments)}]
+    rows.append({"benchmark": f"search k={k} ({len(store.segments)} segments, flat)", "size": size,
+                 **latency_summary(_search_latencies(store, query_vectors, k))})
+
+    start = time.perf_counter()
+    store.compact(force=True)
+    # Segments below IndexConfig.min_segment_size stay flat whatever the configured type
+    built = index_type if any(segment.ann is not None for segment in store.segments) else "flat"
+    rows.append({"benchmark": f"compact ({built})", "size": size,
+                 "seconds": round(time.perf_counter() - start, 3), "disk_mb": _disk_mb(path)})
+    rows.append({"benchmark": f"search k={k} (compacted, {built})", "size": size,
+                 **latency_summary(_search_latencies(store, query_vectors, k))})
+
+    start = time.perf_counter()
+    loaded = SegmentedVectorStore.load(path, embedding)
+    load_seconds = time.perf_counter() - start
+    # The first searches fault the mapped segment in from the page cache
+    rows.append({"benchmark": "load", "size": size, "seconds": round(load_seconds, 3),
+                 **latency_summary(_search_latencies(loaded, query_vectors[:10], k))})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="Comma-separated benchmarks to run")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated index sizes in chunks")
+    parser.add_argument("--dim", type=int, default=768, help="Vector dimension (768 for the default model)")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Chunks per add, i.e. per new segment")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--index-type", default=None, help="Index type built at compaction (default: INDEX_TYPE)")
+    parser.add_argument("--texts", type=int, default=2000, help="Texts for the embedding benchmark")
+    parser.add_argument("--concurrency", type=int, default=32, help="Threads for the embedding benchmark")
+    parser.add_argument("--pages", type=int, default=100, help="Pages for the chunking benchmark")
+    parser.add_argument("--path", default=None, help="Directory for benchmark indexes (default: a temp dir)")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    root = args.path or tempfile.mkdtemp(prefix="docsgpt-bench-")
+    offline_environment(os.path.join(root, "store"))
+    from src.ann_index import IndexConfig
+    index_type = args.index_type or IndexConfig().index_type
+
+    only = {name.strip() for name in args.only.split(",")}
+    rows = []
+
+    def record(new_rows: List[Dict]):
+        # Large index sizes take minutes; show each result as it comes
+        for row in new_rows:
+            print(f"{row['benchmark']} ({row['size']}): "
+                  + ", ".join(f"{key}={value}" for key, value in row.items() if key not in ("benchmark", "size")),
+                  file=sys.stderr)
+        rows.extend(new_rows)
+
+    try:
+        if "embedding" in only:
+            record(bench_embedding(args.texts, args.concurrency))
+        if "chunking" in only:
+            record(bench_chunking(args.pages))
+        if "index" in only:
+            for size in (int(size) for size in args.sizes.split(",")):
+                path = os.path.join(root, f"index-{size}")
+                try:
+                    record(bench_index(size, args.dim, args.batch_size, args.queries, args.k, index_type, path))
+                finally:
+                    shutil.rmtree(path, ignore_errors=True)
+    finally:
+        if not args.path:
+            shutil.rmtree(root, ignore_errors=True)
+    print_table(rows)
+    write_json(rows, args.json)
+
+
+if __name__ == "__main__":
+    # The chunking benchmark's spawned workers re-import this module
+    main()
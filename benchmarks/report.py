@@ -0,0 +1,32 @@
+from typing import Dict, List, Optional, Sequence
+import json
+import numpy as np
+
+
+def latency_summary(latencies_ms: Sequence[float]) -> Dict[str, float]:
+    """Mean and p50/p95/p99 of latencies in milliseconds"""
+    if not latencies_ms:
+        return {"mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "mean_ms": round(float(np.mean(latencies_ms)), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3)
+    }
+
+
+def print_table(rows: List[Dict]):
+    """Rows as an aligned text table with the union of their keys as columns"""
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    cells = [[str(row.get(column, "")) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(row[i]) for row in cells)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def write_json(rows: List[Dict], path: Optional[str]):
+    if path:
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=2)
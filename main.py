@@ -1,8 +1,14 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+from contextlib import asynccontextmanager
 import asyncio
-from src.search_orchestrator import SearchOrchestrator
+import json
+# Only light modules load here; the search stack is imported by warm-up or the first request
+from src.startup import get_search_orchestrator, readiness, warm_up
+from src.metrics import get_metrics
 import os
 from dotenv import load_dotenv
 
@@ -13,7 +19,23 @@ load_dotenv()
 if not os.getenv('GROQ_API_KEY'):
     raise ValueError("GROQ_API_KEY is not set in .env file")
 
-app = FastAPI(title="DocsGPT API")
+WARM_UP_ON_STARTUP = os.getenv('WARM_UP_ON_STARTUP', 'true').lower() == 'true'
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', 10000))
+
+NO_RESULTS = [{
+    "title": "No Results",
+    "explanation": "No relevant documentation found. Try being more specific or rephrasing your query.",
+    "sources": []
+}]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARM_UP_ON_STARTUP:
+        # Runs in the background so liveness answers while models and the index load
+        app.state.warm_up = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+
+app = FastAPI(title="DocsGPT API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -24,12 +46,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize search orchestrator
-search_orchestrator = SearchOrchestrator()
+async def orchestrator():
+    """The search orchestrator, waiting for it to be built if warm-up has not finished"""
+    return await asyncio.to_thread(get_search_orchestrator)
 
 class SearchRequest(BaseModel):
     query: str
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+
+class IngestionRequest(BaseModel):
+    query: Optional[str] = None
+    urls: Optional[List[str]] = None
+
 @app.post("/api/search")
 async def search(request: SearchRequest):
     """
@@ -40,25 +70,110 @@ async def search(request: SearchRequest):
             raise HTTPException(status_code=400, detail="Query cannot be empty")
 
         # Perform search
-        results = await search_orchestrator.search(request.query)
+        results = await (await orchestrator()).search(request.query)
         
         if not results:
-            return {
-                "results": [{
-                    "title": "No Results",
-                    "explanation": "No relevant documentation found. Try being more specific or rephrasing your query.",
-                    "sources": []
-                }]
-            }
+            return {"results": NO_RESULTS}
         
         return {"results": results}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/search/stream")
+async def search_stream(request: SearchRequest):
+    """
+    Streaming search endpoint. Responds with newline-delimited JSON events:
+    the sources as soon as retrieval finishes, then answer tokens as the LLM
+    produces them, then a final "done" event
+    """
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    search_orchestrator = await orchestrator()
+
+    async def event_stream():
+        async for event in search_orchestrator.search_stream(request.query):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/api/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """
+    Batch search endpoint for bulk question answering. Responds with
+    newline-delimited JSON, one {"index", "query", "results"} line per query
+    in the order the answers finish; "index" is the query's position in the request
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Provide at least one query")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"A batch can have at most {BATCH_MAX_QUERIES} queries")
+    if any(not query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    search_orchestrator = await orchestrator()
+
+    async def event_stream():
+        async for event in search_orchestrator.search_batch(request.queries):
+            yield json.dumps({**event, "results": event["results"] or NO_RESULTS}) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/api/jobs", status_code=202)
+async def create_ingestion_job(request: IngestionRequest):
+    """
+    Queue background ingestion of the given URLs, or of the pages Google search
+    finds for the query
+    """
+    if not (request.query and request.query.strip()) and not request.urls:
+        raise HTTPException(status_code=400, detail="Provide a query or URLs to ingest")
+    return await (await orchestrator()).enqueue_ingestion(request.query, request.urls)
+
+@app.get("/api/jobs")
+async def list_ingestion_jobs(status: Optional[str] = None, limit: int = 50):
+    """
+    Most recent ingestion jobs, optionally filtered by status
+    (queued, running, done or failed)
+    """
+    search_orchestrator = await orchestrator()
+    return {"jobs": await asyncio.to_thread(search_orchestrator.ingestion_queue.list, status, limit)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """
+    Status of an ingestion job, including the job_id returned with provisional results
+    """
+    search_orchestrator = await orchestrator()
+    job = await asyncio.to_thread(search_orchestrator.ingestion_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/api/health")
 async def health_check():
     """
-    Health check endpoint
+    Liveness check. Answers as soon as the server is up, without waiting for warm-up
     """
     return {"status": "healthy"}
+
+@app.get("/api/ready")
+async def readiness_check():
+    """
+    Readiness check. 503 until warm-up has built the search stack and loaded the
+    embedding model, with the import and initialisation time of each component.
+    With WARM_UP_ON_STARTUP disabled components load on the first request instead
+    and the server reports ready straight away
+    """
+    report = readiness()
+    ready = report["status"] == "ready" or (not WARM_UP_ON_STARTUP and report["status"] != "failed")
+    return JSONResponse(status_code=200 if ready else 503, content=report)
+
+@app.get("/api/metrics")
+async def metrics():
+    """
+    Prometheus metrics of this worker process: per-stage latency histograms,
+    search outcomes, cache hit ratios, LLM calls and tokens, index size and
+    ingestion jobs
+    """
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
@@ -1,21 +1,48 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+import asyncio
 import os
+import re
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from langchain_groq import ChatGroq
+from .cache import QueryCache
+from .docstore import content_hash
+from .llm_gateway import LLMGateway, get_llm_gateway
 import logging
 
 logger = logging.getLogger(__name__)
 
+_PACKED_SUMMARY_PATTERN = re.compile(r"^\s*\[(\d+)\]\s*(.+?)(?=^\s*\[\d+\]|\Z)", re.MULTILINE | re.DOTALL)
+
+
 class AIEnhancementService:
-    def __init__(self):
-        self.llm = ChatGroq(
-            api_key=os.getenv('GROQ_API_KEY'),
+    """Adds LLM summaries to search results.
+
+    Summaries are generated concurrently (at most ``SUMMARY_CONCURRENCY`` LLM calls
+    at a time), short results are packed up to ``SUMMARY_PACK_SIZE`` per prompt,
+    summaries are cached by content hash, and ``enhance_results`` returns whatever
+    is done after ``SUMMARY_TIME_BUDGET_SECONDS``.
+    """
+
+    def __init__(self,
+                 max_concurrency: Optional[int] = None,
+                 pack_size: Optional[int] = None,
+                 pack_max_chars: Optional[int] = None,
+                 time_budget: Optional[float] = None,
+                 llm_gateway: Optional[LLMGateway] = None):
+        self.llm = (llm_gateway or get_llm_gateway()).chat_model(
             model_name=os.getenv('SUMMARY_MODEL'),
             temperature=float(os.getenv('SUMMARY_TEMPERATURE'))
         )
         self.summary_chain = self._create_summary_chain()
-        
+        self.packed_summary_chain = self._create_packed_summary_chain()
+        self._semaphore = asyncio.Semaphore(max_concurrency or int(os.getenv('SUMMARY_CONCURRENCY', 8)))
+        # A pack size of 1 summarises every result on its own
+        self.pack_size = pack_size or int(os.getenv('SUMMARY_PACK_SIZE', 4))
+        self.pack_max_chars = pack_max_chars or int(os.getenv('SUMMARY_PACK_MAX_CHARS', 1500))
+        self.time_budget = time_budget or float(os.getenv('SUMMARY_TIME_BUDGET_SECONDS', 20))
+        # Keyed by content hash, so identical chunks from different searches share a summary
+        self._summary_cache = QueryCache("summary cache")
+
     def _create_summary_chain(self):
         """Create a chain for generating summaries"""
         template = """You are a technical documentation assistant. Provide a concise, accurate summary of the following technical content:
@@ -24,26 +51,118 @@ Content:
 {content}
 
 Summary (be specific and technical):"""
-        
+
         prompt = PromptTemplate(
             template=template,
             input_variables=["content"]
         )
-        
+
+        return LLMChain(llm=self.llm, prompt=prompt)
+
+    def _create_packed_summary_chain(self):
+        """Create a chain summarising several numbered contents in one call"""
+        template = """You are a technical documentation assistant. Provide a concise, accurate summary of each of the following numbered technical contents.
+
+{contents}
+
+Answer with one summary per content, each starting with its number in brackets like [1] (be specific and technical):"""
+
+        prompt = PromptTemplate(
+            template=template,
+            input_variables=["contents"]
+        )
+
         return LLMChain(llm=self.llm, prompt=prompt)
-    
-    def enhance_results(self, results: List[Dict]) -> List[Dict]:
-        """Enhance search results with AI-generated summaries"""
-        enhanced_results = []
-        
+
+    def _packs(self, contents: List[str]) -> List[List[str]]:
+        """Group short contents into packs of up to pack_size; long ones go alone"""
+        packs, pack, pack_chars = [], [], 0
+        for content in contents:
+            if self.pack_size <= 1 or len(content) > self.pack_max_chars:
+                packs.append([content])
+                continue
+            if len(pack) >= self.pack_size or pack_chars + len(content) > self.pack_max_chars * self.pack_size:
+                packs.append(pack)
+                pack, pack_chars = [], 0
+            pack.append(content)
+            pack_chars += len(content)
+        if pack:
+            packs.append(pack)
+        return packs
+
+    async def _summarize(self, content: str) -> str:
+        async with self._semaphore:
+            summary = await self.summary_chain.arun(content=content)
+        self._summary_cache.set(content_hash(content), summary)
+        return summary
+
+    async def _summarize_pack(self, pack: List[str]) -> Dict[str, str]:
+        """
+        Summaries of every content in the pack, keyed by content. A content whose
+        summary could not be generated maps to an error message instead
+        """
+        summaries = {}
+        if len(pack) > 1:
+            contents = "\n\n".join(f"[{i}] {content}" for i, content in enumerate(pack, start=1))
+            try:
+                async with self._semaphore:
+                    response = await self.packed_summary_chain.arun(contents=contents)
+            except Exception as e:
+                logger.error(f"Error generating summaries for {len(pack)} results, error: {str(e)}")
+                return {content: f"Error generating summary: {str(e)}" for content in pack}
+            for number, summary in _PACKED_SUMMARY_PATTERN.findall(response):
+                index = int(number) - 1
+                if 0 <= index < len(pack) and summary.strip():
+                    summaries[pack[index]] = summary.strip()
+                    self._summary_cache.set(content_hash(pack[index]), summary.strip())
+
+        # Summarise on their own any contents the model skipped in its answer
+        missing = [content for content in pack if content not in summaries]
+        outcomes = await asyncio.gather(*(self._summarize(c) for c in missing), return_exceptions=True)
+        for content, summary in zip(missing, outcomes):
+            if isinstance(summary, Exception):
+                logger.error(f"Error generating summary, error: {str(summary)}")
+                summary = f"Error generating summary: {str(summary)}"
+            summaries[content] = summary
+        return summaries
+
+    async def enhance_results(self, results: List[Dict], time_budget: Optional[float] = None) -> List[Dict]:
+        """
+        Enhance search results with AI-generated summaries. Results not summarised
+        within the time budget get a None summary
+        """
+        pending = []
         for result in results:
+            cached = self._summary_cache.get(content_hash(result['content']))
+            if cached is not None:
+                result['summary'] = cached
+            else:
+                pending.append(result['content'])
+        if not pending:
+            return results
+
+        summaries = {}
+        tasks = {
+            asyncio.ensure_future(self._summarize_pack(pack)): pack
+            for pack in self._packs(list(dict.fromkeys(pending)))
+        }
+        done, not_done = await asyncio.wait(tasks, timeout=time_budget or self.time_budget)
+        for task in not_done:
+            task.cancel()
+            # Keep what a cancelled pack already summarised
+            for content in tasks[task]:
+                summaries[content] = self._summary_cache.get(content_hash(content))
+        if not_done:
+            logger.warning(f"Summary time budget exceeded, {len(not_done)} of {len(tasks)} summary calls cancelled")
+        for task in done:
             try:
-                summary = self.summary_chain.run(content=result['content'])
-                result['summary'] = summary
-                enhanced_results.append(result)
+                summaries.update(task.result())
             except Exception as e:
-                logger.error(f"Error generating summary for result: {result['content']}, error: {str(e)}")
-                result['summary'] = f"Error generating summary: {str(e)}"
-                enhanced_results.append(result)
-            
-        return enhanced_results
+                logger.error(f"Error generating summaries for {len(tasks[task])} results, error: {str(e)}")
+                for content in tasks[task]:
+                    summaries[content] = f"Error generating summary: {str(e)}"
+
+        for result in results:
+            if 'summary' not in result:
+                result['summary'] = summaries.get(result['content'])
+        return results
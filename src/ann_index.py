@@ -0,0 +1,116 @@
+from typing import Any, Dict, Optional
+import math
+import os
+import numpy as np
+import faiss
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+
+class IndexConfig:
+    """Which approximate index to build for large segments, and how to search it.
+
+    ``flat`` keeps exact brute-force search. The other types are built only for
+    segments with at least ``min_segment_size`` vectors (compacted or rebuilt
+    segments); smaller append segments are always searched exactly. All
+    parameters are stored in the manifest, but the search-time knobs (``nprobe``,
+    ``ef_search``) set in the environment override them on every load.
+    """
+
+    def __init__(self,
+                 index_type: Optional[str] = None,
+                 min_segment_size: Optional[int] = None,
+                 hnsw_m: Optional[int] = None,
+                 ef_construction: Optional[int] = None,
+                 ef_search: Optional[int] = None,
+                 nlist: Optional[int] = None,
+                 nprobe: Optional[int] = None,
+                 pq_m: Optional[int] = None,
+                 pq_bits: Optional[int] = None):
+        self.index_type = (index_type or os.getenv('INDEX_TYPE', 'flat')).lower()
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {self.index_type}, expected one of {', '.join(INDEX_TYPES)}")
+        self.min_segment_size = min_segment_size or int(os.getenv('ANN_MIN_SEGMENT_SIZE', 10000))
+        self.hnsw_m = hnsw_m or int(os.getenv('HNSW_M', 32))
+        self.ef_construction = ef_construction or int(os.getenv('HNSW_EF_CONSTRUCTION', 200))
+        self.ef_search = ef_search or int(os.getenv('HNSW_EF_SEARCH', 64))
+        # 0 picks 4 * sqrt(n) lists at build time
+        self.nlist = nlist if nlist is not None else int(os.getenv('IVF_NLIST', 0))
+        self.nprobe = nprobe or int(os.getenv('IVF_NPROBE', 16))
+        self.pq_m = pq_m or int(os.getenv('PQ_M', 16))
+        self.pq_bits = pq_bits or int(os.getenv('PQ_BITS', 8))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index_type": self.index_type,
+            "min_segment_size": self.min_segment_size,
+            "hnsw_m": self.hnsw_m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "pq_m": self.pq_m,
+            "pq_bits": self.pq_bits
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IndexConfig":
+        """Parameters from a manifest, with search parameters set in the environment taking precedence"""
+        data = dict(data)
+        for key, env in (("ef_search", 'HNSW_EF_SEARCH'), ("nprobe", 'IVF_NPROBE')):
+            if os.getenv(env):
+                data.pop(key, None)
+        return cls(**data)
+
+    def _factory_string(self, n: int, dimension: int) -> str:
+        if self.index_type == "hnsw":
+            return f"HNSW{self.hnsw_m},Flat"
+        # Roughly 39 training points per list are needed for stable k-means
+        nlist = self.nlist or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // 39))
+        if self.index_type == "ivf_flat":
+            return f"IVF{nlist},Flat"
+        pq_m = self.pq_m
+        while dimension % pq_m:
+            pq_m -= 1
+        return f"IVF{nlist},PQ{pq_m}x{self.pq_bits}"
+
+    @property
+    def min_training_size(self) -> int:
+        """Fewest vectors the index can be trained on; PQ needs one per centroid of each codebook"""
+        return 2 ** self.pq_bits if self.index_type == "ivf_pq" else 1
+
+    def build(self, vectors: np.ndarray) -> Optional[faiss.Index]:
+        """Build the configured index over ``vectors``, or None if exact search should be used"""
+        if self.index_type == "flat" or len(vectors) < max(self.min_segment_size, self.min_training_size):
+            return None
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        factory = self._factory_string(len(vectors), vectors.shape[1])
+        index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+        if self.index_type == "hnsw":
+            index.hnsw.efConstruction = self.ef_construction
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        self.tune(index)
+        logger.info(f"Built {factory} index over {len(vectors)} vectors")
+        return index
+
+    def tune(self, index: faiss.Index):
+        """Apply the search-time parameters to a built or loaded index of any type"""
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.ef_search
+        elif (ivf := faiss.try_extract_index_ivf(index)) is not None:
+            ivf.nprobe = self.nprobe
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """Parameters restricting a search of ``index`` to ``selector`` at the index's tuned efSearch or nprobe"""
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if (ivf := faiss.try_extract_index_ivf(index)) is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=selector)
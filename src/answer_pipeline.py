@@ -0,0 +1,199 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import os
+from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
+from langchain.retrievers import ContextualCompressionRetriever
+from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
+from .context_assembly import ContextAssembler
+from .metrics import get_metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+ANSWER_PROMPT = PromptTemplate(
+    template="""You are a professional technical documentation assistant. Use the following pieces of context to provide a comprehensive and precise answer to the question.
+    If the context lacks sufficient information, clearly state what is known and what additional details might be necessary.
+    Always include pertinent code examples when applicable.
+
+    Context: {context}
+    Question: {question}
+
+    Detailed Answer:""",
+    input_variables=["context", "question"]
+)
+
+
+def document_sources(docs: List[Document]) -> List[str]:
+    """Source URLs of the retrieved documents"""
+    return [
+        doc.metadata.get('source', '')
+        for doc in docs
+        if doc.metadata.get('source')
+    ]
+
+
+class AnswerPipeline:
+    """RetrievalQA pipeline that is built once and reused for every query.
+
+    The prompt and the "stuff" documents chain are created up front; only the
+    retriever is swapped, and only when the ingestion pipeline reports a new
+    index version. Queries run fully async (async retriever and LLM calls),
+    bounded by ``MAX_CONCURRENT_QUERIES`` in-flight answers. Retrieved chunks go
+    through the ``ContextAssembler`` so the prompt stays within its token budget.
+    ``answer_batch`` answers many queries at once, generating at most
+    ``BATCH_MAX_CONCURRENCY`` of them at a time.
+    """
+
+    def __init__(self,
+                 llm,
+                 content_ingestion,
+                 max_concurrency: Optional[int] = None,
+                 context_assembler: Optional[ContextAssembler] = None):
+        self.llm = llm
+        self.content_ingestion = content_ingestion
+        self.context_assembler = context_assembler or ContextAssembler()
+        self.metrics = get_metrics()
+        self._semaphore = asyncio.Semaphore(
+            max_concurrency or int(os.getenv('MAX_CONCURRENT_QUERIES', 64))
+        )
+        self.batch_concurrency = int(os.getenv('BATCH_MAX_CONCURRENCY', 8))
+        self.combine_documents_chain = load_qa_chain(
+            llm,
+            chain_type="stuff",
+            prompt=ANSWER_PROMPT
+        )
+        self._chain = None
+        self._index_version = None
+
+    @property
+    def chain(self) -> Optional[RetrievalQA]:
+        """QA chain bound to the current vector store, or None if there is none yet"""
+        version = self.content_ingestion.index_version
+        if self._index_version != version:
+            retriever = self.content_ingestion.get_retriever()
+            self._chain = RetrievalQA(
+                combine_documents_chain=self.combine_documents_chain,
+                retriever=ContextualCompressionRetriever(
+                    base_compressor=self.context_assembler,
+                    base_retriever=retriever
+                ),
+                return_source_documents=True
+            ) if retriever else None
+            self._index_version = version
+        return self._chain
+
+    async def answer(self, query: str) -> Optional[Dict]:
+        """
+        Run retrieval plus a single LLM call for the query. Returns None, without
+        calling the LLM, when there is no vector store or nothing is retrieved
+        """
+        chain = self.chain
+        if chain is None:
+            return None
+        async with self._semaphore:
+            # The chain's two steps run separately so each gets its own timing span
+            with self.metrics.span("retrieval"):
+                docs = await chain.retriever.ainvoke(query)
+            if not docs:
+                return None
+            with self.metrics.span("generation"):
+                result = (await chain.combine_documents_chain.ainvoke(
+                    {"input_documents": docs, "question": query}
+                ))["output_text"]
+            return {"query": query, "result": result, "source_documents": docs}
+
+    async def answer_batch(self,
+                           queries: List[str],
+                           embeddings: Optional[List[List[float]]] = None,
+                           max_concurrency: Optional[int] = None) -> AsyncIterator[Tuple[int, Optional[Dict]]]:
+        """
+        Answer many queries, yielding ``(position, response)`` as each finishes,
+        with responses shaped like ``answer``'s.
+
+        The queries are embedded in one batch (unless ``embeddings`` are given)
+        and searched in one index pass. Queries that retrieve the same chunks
+        share one assembled context, repeats among them are answered once, and
+        their generations are started back to back. The response is None when
+        nothing is retrieved or generation fails
+        """
+        if self.chain is None:
+            for position in range(len(queries)):
+                yield position, None
+            return
+        with self.metrics.span("batch_retrieval"):
+            if embeddings is None:
+                embeddings = await self.content_ingestion.embeddings.aembed_documents(list(queries))
+            retrieved = await asyncio.to_thread(self.content_ingestion.retrieve_by_vectors, embeddings)
+
+        # Retrieved chunk ids -> (chunks, question -> positions asking it)
+        groups: Dict[Tuple, Tuple[List[Document], Dict[str, List[int]]]] = {}
+        for position, (query, docs) in enumerate(zip(queries, retrieved)):
+            if not docs:
+                yield position, None
+                continue
+            key = tuple(doc.id or doc.page_content for doc in docs)
+            groups.setdefault(key, (docs, {}))[1].setdefault(query.strip(), []).append(position)
+
+        semaphore = asyncio.Semaphore(max_concurrency or self.batch_concurrency)
+
+        async def generate(question: str,
+                           docs: List[Document],
+                           positions: List[int]) -> Tuple[List[int], Optional[Dict]]:
+            if not docs:
+                return positions, None
+            async with semaphore, self._semaphore:
+                try:
+                    with self.metrics.span("generation"):
+                        result = (await self.combine_documents_chain.ainvoke(
+                            {"input_documents": docs, "question": question}
+                        ))["output_text"]
+                except Exception as e:
+                    logger.warning(f"Batch generation failed: {str(e)}")
+                    return positions, None
+            return positions, {"query": question, "result": result, "source_documents": docs}
+
+        tasks = []
+        for docs, questions in groups.values():
+            # Sentence extraction depends on the question; otherwise the group shares one context
+            shared = None if self.context_assembler.extract_sentences else (
+                self.context_assembler.compress_documents(docs, next(iter(questions)))
+            )
+            for question, positions in questions.items():
+                context = shared if shared is not None else self.context_assembler.compress_documents(docs, question)
+                tasks.append(asyncio.create_task(generate(question, context, positions)))
+        logger.info(f"Generating {len(tasks)} answers over {len(groups)} distinct contexts")
+        try:
+            for future in asyncio.as_completed(tasks):
+                positions, response = await future
+                for position in positions:
+                    yield position, response
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream(self, query: str) -> AsyncIterator[Dict]:
+        """Yield a ``sources`` event as soon as retrieval finishes, then ``token`` events.
+
+        Nothing is yielded when there is no vector store or retrieval finds no documents.
+        """
+        chain = self.chain
+        if chain is None:
+            return
+        async with self._semaphore:
+            with self.metrics.span("retrieval"):
+                docs = await chain.retriever.ainvoke(query)
+            if not docs:
+                return
+            yield {"type": "sources", "sources": document_sources(docs)}
+
+            prompt = ANSWER_PROMPT.format(
+                context="\n\n".join(doc.page_content for doc in docs),
+                question=query
+            )
+            # Includes the time the caller takes to consume each token
+            with self.metrics.span("generation_stream"):
+                async for chunk in self.llm.astream(prompt):
+                    if chunk.content:
+                        yield {"type": "token", "content": chunk.content}
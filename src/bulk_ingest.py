@@ -0,0 +1,358 @@
+"""Bulk-load documentation into the vector store ahead of any query.
+
+    python -m src.bulk_ingest --dir docs/ --base-url https://docs.example.com/
+    python -m src.bulk_ingest --sitemap https://docs.example.com/sitemap.xml
+    python -m src.bulk_ingest --urls urls.txt --concurrency 32
+
+Documents stream through parsing and chunking (in the process pool),
+deduplication, batched embedding and one index write per ``--segment-size``
+chunks, so memory stays bounded however large the corpus. A page is recorded
+in the URL registry only once the segment holding its chunks is written, which
+makes the registry the checkpoint: rerunning an interrupted (or finished)
+command skips what is already indexed and unchanged. The new segments are
+compacted by size tier at the end. Run it with the server stopped, or it
+cannot take the index writer lock.
+"""
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import gzip
+import os
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urljoin
+from .content_ingestion import VECTOR_STORE_PATH, ContentIngestionPipeline
+from .docstore import content_hash
+from .text_processing import aparse_and_chunk
+import logging
+
+logger = logging.getLogger(__name__)
+
+HTML_EXTENSIONS = (".html", ".htm")
+MARKDOWN_EXTENSIONS = (".md", ".markdown", ".mdx")
+PROGRESS_SECONDS = 10
+
+# Loads a document as (chunks, registry record); (None, None) means it was
+# skipped as unchanged or could not be read
+Loader = Callable[[], Awaitable[Tuple[Optional[List[Dict]], Optional[Dict]]]]
+
+
+class IngestionReport:
+    """Counters and per-stage busy time of a bulk ingestion run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.documents = 0
+        self.loaded = 0
+        self.chunks = 0
+        self.duplicates = 0
+        self.indexed = 0
+        self.segments = 0
+        self.stage_seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def progress(self) -> str:
+        return (f"{self.documents} documents ({self.loaded} new or changed), {self.chunks} chunks, "
+                f"{self.indexed} indexed in {self.elapsed:.0f}s")
+
+    def summary(self) -> Dict:
+        elapsed = self.elapsed
+        return {
+            "documents": self.documents,
+            "skipped": self.documents - self.loaded,
+            "chunks": self.chunks,
+            "duplicates": self.duplicates,
+            "indexed": self.indexed,
+            "segments_written": self.segments,
+            "seconds": round(elapsed, 1),
+            "documents_per_second": round(self.documents / elapsed, 1) if elapsed else 0.0,
+            "chunks_per_second": round(self.indexed / elapsed, 1) if elapsed else 0.0,
+            **{f"{name}_seconds": round(seconds, 1) for name, seconds in self.stage_seconds.items()}
+        }
+
+
+def _read_text(path: str) -> str:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        data = f.read()
+    return gzip.decompress(data) if path.endswith(".gz") else data
+
+
+def _sitemap_locations(data: bytes) -> Tuple[bool, List[str]]:
+    """Whether the document is a sitemap index, and the <loc> URLs it lists"""
+    is_index, locations = False, []
+    for _, element in ElementTree.iterparse(BytesIO(data), events=("end",)):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "loc" and element.text:
+            locations.append(element.text.strip())
+        elif tag == "sitemapindex":
+            is_index = True
+        element.clear()
+    return is_index, locations
+
+
+class BulkIngester:
+    """Streams documents from local directories, sitemaps and URL lists into the index"""
+
+    def __init__(self,
+                 content_ingestion: ContentIngestionPipeline,
+                 concurrency: int = 16,
+                 batch_size: int = 256,
+                 segment_size: int = 10000):
+        self.content_ingestion = content_ingestion
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.segment_size = segment_size
+        self.report = IngestionReport()
+
+    # Sources
+
+    async def directory(self, path: str, base_url: Optional[str] = None) -> AsyncIterator[Tuple[str, Loader]]:
+        """HTML and Markdown files under ``path``, sourced as ``base_url`` plus their relative path"""
+        root = Path(path).resolve()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                file_path = Path(dirpath, filename)
+                if file_path.suffix.lower() not in HTML_EXTENSIONS + MARKDOWN_EXTENSIONS:
+                    continue
+                relative = file_path.relative_to(root).as_posix()
+                url = urljoin(base_url.rstrip("/") + "/", relative) if base_url else file_path.as_uri()
+                yield url, self._file_loader(str(file_path), url)
+
+    def _file_loader(self, path: str, url: str) -> Loader:
+        async def load():
+            try:
+                text = await asyncio.to_thread(_read_text, path)
+            except OSError as e:
+                logger.error(f"Error reading {path}: {str(e)}")
+                return None, None
+            page_hash = content_hash(text)
+            record = self.content_ingestion.url_registry.get(url)
+            if record and record["content_hash"] == page_hash:
+                return None, None
+            with self.report.stage("chunk"):
+                chunks = await aparse_and_chunk(
+                    text, url, markdown=path.lower().endswith(MARKDOWN_EXTENSIONS)
+                )
+            return chunks, {"url": url, "content_hash": page_hash}
+
+        return load
+
+    def _url_loader(self, url: str) -> Loader:
+        async def load():
+            # Skips fresh URLs and re-fetches older ones conditionally, like query-time ingestion
+            with self.report.stage("fetch_and_chunk"):
+                return await self.content_ingestion._process_url(url)
+
+        return load
+
+    async def sitemap(self, location: str) -> AsyncIterator[Tuple[str, Loader]]:
+        """Pages listed in a sitemap file or URL, following sitemap indexes"""
+        try:
+            if location.startswith(("http://", "https://")):
+                response = await self.content_ingestion.fetcher.fetch(location)
+                data = response["text"].encode()
+            else:
+                data = await asyncio.to_thread(_read_bytes, location)
+            is_index, locations = _sitemap_locations(data)
+        except Exception as e:
+            logger.error(f"Error reading sitemap {location}: {str(e)}")
+            return
+        for url in locations:
+            if is_index:
+                async for document in self.sitemap(url):
+                    yield document
+            else:
+                yield url, self._url_loader(url)
+
+    async def url_list(self, path: str) -> AsyncIterator[Tuple[str, Loader]]:
+        """URLs listed one per line in a file ('-' for stdin), skipping blanks and # comments"""
+        lines = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for line in lines:
+                url = line.strip()
+                if url and not url.startswith("#"):
+                    yield url, self._url_loader(url)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+
+    # Pipeline
+
+    async def run(self, sources: List[AsyncIterator[Tuple[str, Loader]]]) -> Dict:
+        """Ingest every document of the sources and return the throughput report"""
+        documents: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        loaded: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def produce():
+            try:
+                for source in sources:
+                    async for document in source:
+                        await documents.put(document)
+            finally:
+                # Stop the loaders even if a source failed; its error surfaces from gather
+                for _ in range(self.concurrency):
+                    await documents.put(None)
+
+        async def load():
+            while (document := await documents.get()) is not None:
+                url, loader = document
+                try:
+                    chunks, record = await loader()
+                except Exception as e:
+                    logger.error(f"Error loading {url}: {str(e)}")
+                    chunks, record = None, None
+                await loaded.put((chunks, record))
+            await loaded.put(None)
+
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(load()) for _ in range(self.concurrency)]
+        try:
+            await self._index(loaded)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self.report.summary()
+
+    async def _index(self, loaded: asyncio.Queue):
+        """Deduplicate, embed in batches and write a segment every ``segment_size`` chunks"""
+        batch: List[Dict] = []
+        texts, vectors, metadatas, records = [], [], [], []
+        claimed: List[str] = []
+        last_progress = time.monotonic()
+
+        async def embed():
+            with self.report.stage("dedupe"):
+                unique = self.content_ingestion._deduplicate(batch)
+            self.report.duplicates += len(batch) - len(unique)
+            batch.clear()
+            if unique:
+                batch_texts = [doc["content"] for doc in unique]
+                claimed.extend(batch_texts)
+                with self.report.stage("embed"):
+                    vectors.extend(await self.content_ingestion.embeddings.aembed_documents(batch_texts))
+                texts.extend(batch_texts)
+                metadatas.extend(doc["metadata"] for doc in unique)
+
+        async def write():
+            # Changed pages' new chunks replace all of their old ones
+            sources = [record["url"] for record in records]
+            if texts:
+                store = self.content_ingestion.ensure_vector_store()
+                with self.report.stage("write"):
+                    await asyncio.to_thread(
+                        store.add_embeddings, list(texts), list(vectors), list(metadatas), None, sources
+                    )
+                # Stored chunks are found in the docstore from now on
+                self.content_ingestion._release(claimed)
+                self.content_ingestion.index_version += 1
+                self.report.indexed += len(texts)
+                self.report.segments += 1
+            elif sources and self.content_ingestion.vector_store is not None:
+                await asyncio.to_thread(self.content_ingestion.vector_store.docstore.delete_sources, sources)
+            # Only now are these pages' chunks durable; record them so a rerun skips them
+            for record in records:
+                self.content_ingestion.url_registry.record(**record)
+            for buffer in (texts, vectors, metadatas, records, claimed):
+                buffer.clear()
+
+        finished = 0
+        while finished < self.concurrency:
+            item = await loaded.get()
+            if item is None:
+                finished += 1
+                continue
+            chunks, record = item
+            self.report.documents += 1
+            if record is not None:
+                self.report.loaded += 1
+                records.append(record)
+            if chunks:
+                self.report.chunks += len(chunks)
+                batch.extend(chunks)
+            if len(batch) >= self.batch_size:
+                await embed()
+            if len(texts) >= self.segment_size:
+                await write()
+            if time.monotonic() - last_progress >= PROGRESS_SECONDS:
+                logger.info(f"Ingested {self.report.progress()}")
+                last_progress = time.monotonic()
+        await embed()
+        await write()
+
+    def compact(self):
+        """Merge the run's segments tier by tier, building the configured ANN index for the large ones"""
+        store = self.content_ingestion.vector_store
+        if store is not None and self.report.segments:
+            with self.report.stage("compact"):
+                while store.compact():
+                    pass
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--dir", action="append", default=[], help="Directory of HTML and Markdown files")
+    parser.add_argument("--base-url", help="URL the --dir files are published under (default: file:// URLs)")
+    parser.add_argument("--sitemap", action="append", default=[], help="Sitemap (or sitemap index) file or URL")
+    parser.add_argument("--urls", action="append", default=[], help="File of URLs, one per line ('-' for stdin)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Documents fetched and parsed at once")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch")
+    parser.add_argument("--segment-size", type=int, default=10000, help="Chunks per index write")
+    parser.add_argument("--no-compact", action="store_true", help="Leave the new segments to background compaction")
+    args = parser.parse_args(argv)
+    if not (args.dir or args.sitemap or args.urls):
+        parser.error("Give at least one --dir, --sitemap or --urls")
+    logging.basicConfig(level=logging.INFO)
+
+    content_ingestion = ContentIngestionPipeline()
+    if not content_ingestion.is_writer:
+        parser.error(f"Another process writes the index at {VECTOR_STORE_PATH}; stop it first")
+    ingester = BulkIngester(content_ingestion, args.concurrency, args.batch_size, args.segment_size)
+    sources = [ingester.directory(path, args.base_url) for path in args.dir]
+    sources += [ingester.sitemap(location) for location in args.sitemap]
+    sources += [ingester.url_list(path) for path in args.urls]
+
+    async def run():
+        try:
+            return await ingester.run(sources)
+        finally:
+            await content_ingestion.fetcher.aclose()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print(f"Interrupted after {ingester.report.progress()}; rerun the command to resume", file=sys.stderr)
+        sys.exit(130)
+    if not args.no_compact:
+        ingester.compact()
+    for name, value in ingester.report.summary().items():
+        print(f"{name:<24}{value:>12}")
+
+
+if __name__ == "__main__":
+    # Spawned chunking workers re-import this module
+    main()
@@ -0,0 +1,161 @@
+from typing import Any, Dict, Hashable, List, Optional
+from collections import OrderedDict
+import os
+import pickle
+import sys
+import threading
+import time
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached value in bytes"""
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class _CacheEntry:
+    __slots__ = ("value", "expires_at", "size", "embedding")
+
+    def __init__(self, value, expires_at, size, embedding):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.embedding = embedding
+
+
+class QueryCache:
+    """Bounded LRU cache with TTL expiry, a memory budget and index-version invalidation.
+
+    Entries are evicted least-recently-used first once either ``max_entries`` or
+    ``max_bytes`` is exceeded, and are dropped after ``ttl`` seconds. Passing an
+    index ``version`` to ``get``/``set`` clears the cache whenever a newer version
+    is seen; values computed against an older version are not stored. With a ``semantic_threshold`` set, ``get_similar`` returns the value of
+    the cached entry whose embedding has the highest cosine similarity to the
+    given one, if it reaches the threshold.
+    """
+
+    def __init__(self,
+                 name: str = "cache",
+                 max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None,
+                 semantic_threshold: Optional[float] = None):
+        self.name = name
+        self.max_entries = max_entries or int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+        self.ttl = ttl or float(os.getenv('CACHE_TTL_SECONDS', 3600))
+        self.max_bytes = max_bytes or int(float(os.getenv('CACHE_MAX_MB', 64)) * 1024 * 1024)
+        self.semantic_threshold = semantic_threshold
+        self.version = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, version) -> bool:
+        """Invalidate the cache on a newer index version; False if ``version`` is older than the cache's"""
+        if version is None or version == self.version:
+            return True
+        if self.version is not None and version < self.version:
+            return False
+        if self._entries:
+            logger.info(f"Index version changed, invalidating {len(self._entries)} {self.name} entries")
+        self._entries.clear()
+        self._bytes = 0
+        self.version = version
+        return True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def get(self, key: Hashable, version=None) -> Optional[Any]:
+        """Return the cached value for ``key``, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key) if self._check_version(version) else None
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def get_similar(self, embedding: List[float], version=None) -> Optional[Any]:
+        """Return the value of the closest cached entry within the semantic threshold"""
+        if self.semantic_threshold is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        now = time.monotonic()
+        with self._lock:
+            if not self._check_version(version):
+                return None
+            best_key, best_score = None, self.semantic_threshold
+            for key, entry in self._entries.items():
+                if entry.embedding is None or entry.expires_at < now:
+                    continue
+                score = float(np.dot(query, entry.embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key].value
+
+    def set(self, key: Hashable, value: Any, version=None, embedding: Optional[List[float]] = None):
+        """Cache ``value`` under ``key``, evicting old entries to stay within budget"""
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding /= np.linalg.norm(embedding) or 1.0
+        with self._lock:
+            # A value computed before the index changed would outlive the invalidation
+            if not self._check_version(version):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(value, time.monotonic() + self.ttl, size, embedding)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size.
+
+        Semantic hits are lookups that missed on the exact key but were served by
+        ``get_similar``, so they are counted among the misses as well.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+        }
@@ -1,134 +1,320 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 import asyncio
-from datetime import datetime
-from langchain.document_loaders import WebBaseLoader
-from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
+from langchain_core.documents import Document
+import threading
+import time
+from .embedding_service import get_embedding_service
+from .index_service import UNIX_SOCKETS, EmbeddingServer, RemoteEmbeddingService, WriterLock
+from .vector_store import MANIFEST_FILE, SegmentedVectorStore
+from .docstore import content_hash
+from .url_registry import URLRegistry
+from .http_fetcher import AsyncFetcher, get_fetcher
+from .metrics import get_metrics
+from .text_processing import aparse_and_chunk
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+VECTOR_STORE_PATH = os.getenv('VECTOR_STORE_PATH', 'vectorstore.faiss')
+# Minimum relevance (0 to 1) of a retrieved chunk
+RETRIEVAL_SCORE_THRESHOLD = 0.5
+
 class ContentIngestionPipeline:
-    def __init__(self):
+    """
+    Ingests pages into the vector store and serves its retriever.
+
+    Several worker processes can share one VECTOR_STORE_PATH: the first to take
+    the writer lock ingests, compacts and (with SHARED_EMBEDDINGS) serves its
+    embedding model to the others. The rest map the same segments read-only,
+    pick up new ones every INDEX_REFRESH_SECONDS and take over as writer if
+    the writer process exits.
+    """
+
+    def __init__(self, fetcher: Optional[AsyncFetcher] = None):
         self.vector_store = None
-        self.embeddings = HuggingFaceEmbeddings()
+        self.fetcher = fetcher or get_fetcher()
+        # Bumped whenever the vector store changes so consumers can rebuild derived state
+        self.index_version = 0
+        self.shared_embeddings = os.getenv('SHARED_EMBEDDINGS', str(UNIX_SOCKETS)).lower() == 'true'
+        if self.shared_embeddings and not UNIX_SOCKETS:
+            logger.warning("SHARED_EMBEDDINGS needs Unix domain sockets; each process loads its own model instead")
+            self.shared_embeddings = False
+        self.refresh_interval = float(os.getenv('INDEX_REFRESH_SECONDS', 2))
+        # Answer generation trims the retrieved chunks to its context token budget
+        self.retrieval_k = int(os.getenv('RETRIEVAL_K', 3))
+        self.metrics = get_metrics()
+        self.writer_lock = WriterLock(VECTOR_STORE_PATH)
+        self._refresh_lock = threading.Lock()
+        # Hashes of chunks accepted for indexing but not stored yet, shared by concurrent ingestions
+        self._claimed_hashes: Set[str] = set()
+        self._claims_lock = threading.Lock()
+        # Lives next to the index so both are discarded together
+        self.url_registry = URLRegistry(os.path.join(VECTOR_STORE_PATH, "url_registry.sqlite"))
+        if self.writer_lock.try_acquire():
+            self.embeddings = get_embedding_service()
+            self._serve_embeddings()
+        else:
+            logger.info("Another process writes the index; following it read-only")
+            self.embeddings = (
+                RemoteEmbeddingService(VECTOR_STORE_PATH) if self.shared_embeddings else get_embedding_service()
+            )
+            threading.Thread(target=self._follow_writer, name="index-follower", daemon=True).start()
         self._load_vector_store()
 
+    @property
+    def is_writer(self) -> bool:
+        """Whether this process holds the writer lock and may change the index"""
+        return self.writer_lock.held
+
+    def _serve_embeddings(self):
+        if self.shared_embeddings:
+            EmbeddingServer(self.embeddings, VECTOR_STORE_PATH).start()
+
+    @staticmethod
+    def _index_exists() -> bool:
+        """Whether VECTOR_STORE_PATH holds an index, in segments or the legacy single-file format"""
+        return any(
+            os.path.exists(os.path.join(VECTOR_STORE_PATH, name))
+            for name in (MANIFEST_FILE, "index.faiss")
+        )
+
     def _load_vector_store(self):
         """Load existing vector store if available"""
+        if self._index_exists() and not self.embeddings.matches_index(VECTOR_STORE_PATH):
+            # Appending vectors of another model would corrupt the index, and starting
+            # afresh would overwrite its segments while its documents stay behind
+            raise RuntimeError(
+                f"The index at {VECTOR_STORE_PATH} was built with another embedding model; "
+                f"restore EMBEDDING_PROVIDER and EMBEDDING_MODEL, or move the index away to rebuild it"
+            )
         try:
-            if os.path.exists("vectorstore.faiss"):
-                self.vector_store = FAISS.load_local(
-                    "vectorstore.faiss",
-                    self.embeddings
+            if os.path.exists(VECTOR_STORE_PATH):
+                self.vector_store = SegmentedVectorStore.load(
+                    VECTOR_STORE_PATH,
+                    self.embeddings,
+                    read_only=not self.is_writer
                 )
+                if self.is_writer:
+                    self.vector_store.start_background_compaction()
+                self.index_version += 1
                 logger.info("Loaded existing vector store")
         except Exception as e:
             logger.error(f"Error loading vector store: {str(e)}")
 
+    def refresh(self) -> bool:
+        """Pick up segments the writer process has added; returns whether the index changed"""
+        with self._refresh_lock:
+            if self.vector_store is None:
+                if not os.path.exists(os.path.join(VECTOR_STORE_PATH, MANIFEST_FILE)):
+                    return False
+                self._load_vector_store()
+                return self.vector_store is not None
+            if not self.vector_store.refresh():
+                return False
+            self.index_version += 1
+            return True
+
+    def _follow_writer(self):
+        """Refresh the read-only index until this process becomes the writer"""
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                if self.writer_lock.try_acquire():
+                    logger.info("Writer process exited; taking over index writes")
+                    self.embeddings = get_embedding_service()
+                    self._serve_embeddings()
+                    self.refresh()
+                    if self.vector_store is not None:
+                        self.vector_store.embedding = self.embeddings
+                        self.vector_store.start_background_compaction()
+                    return
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing vector store: {str(e)}")
+
     def save_vector_store(self):
-        """Save vector store to disk"""
+        """
+        Compact the vector store on disk. Batches are already persisted as they
+        are added, so this only merges the accumulated segments
+        """
         try:
-            if self.vector_store:
-                self.vector_store.save_local("vectorstore.faiss")
+            if self.vector_store and self.is_writer:
+                self.vector_store.compact()
                 logger.info("Vector store saved successfully")
         except Exception as e:
             logger.error(f"Error saving vector store: {str(e)}")
 
     def get_retriever(self):
         """Get retriever with optimized settings"""
-        if not self.vector_store:
+        if not self.vector_store or not self.vector_store.ntotal:
             return None
 
         return self.vector_store.as_retriever(
             search_type="similarity_score_threshold",
             search_kwargs={
-                "k": 3,
-                "score_threshold": 0.5,
-                "fetch_k": 10
+                "k": self.retrieval_k,
+                "score_threshold": RETRIEVAL_SCORE_THRESHOLD,
+                "fetch_k": max(10, self.retrieval_k)
             }
         )
 
-    async def process_url(self, url: str) -> Optional[List[Dict]]:
-        """Process a single URL and extract content"""
+    def retrieve_by_vectors(self, embeddings: List[List[float]]) -> List[List[Document]]:
+        """
+        The documents the retriever would return for each of several embedded
+        queries, found with one index pass and one docstore read
+        """
+        if not self.vector_store or not self.vector_store.ntotal:
+            return [[] for _ in embeddings]
+        relevance = self.vector_store._select_relevance_score_fn()
+        return [
+            [doc for doc, distance in hits if relevance(distance) >= RETRIEVAL_SCORE_THRESHOLD]
+            for hits in self.vector_store.similarity_search_with_score_by_vectors(embeddings, self.retrieval_k)
+        ]
+
+    async def _fetch(self, url: str, record: Optional[Dict]) -> Tuple[int, str, Dict[str, str]]:
+        """Fetch a page conditionally, returning status, body and response headers"""
+        response = await self.fetcher.fetch(url, headers=self.url_registry.conditional_headers(record))
+        return response["status"], response["text"], response["headers"]
+
+    async def _process_url(self, url: str) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
+        """
+        Fetch and split a URL unless it is fresh or unchanged. Returns the chunk
+        documents and the registry record to store once they are indexed
+        """
         try:
-            # Load and process webpage
-            loader = WebBaseLoader(url)
-            docs = await asyncio.to_thread(loader.load)
+            record = self.url_registry.get(url)
+            if self.url_registry.is_fresh(record):
+                logger.info(f"Skipping recently ingested URL {url}")
+                return None, None
             
-            if not docs:
-                return None
+            with self.metrics.span("fetch"):
+                status, html, headers = await self._fetch(url, record)
+            page_hash = content_hash(html)
+            if status == 304 or (record and record["content_hash"] == page_hash):
+                logger.info(f"URL {url} not modified since last ingestion")
+                self.url_registry.touch(url)
+                return None, None
             
-            # Process first document
-            doc = docs[0]
+            if not html:
+                return None, None
             
-            # Split into chunks
-            from langchain.text_splitter import RecursiveCharacterTextSplitter
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len,
-                separators=["\n\n", "\n", ". ", " ", ""]
-            )
-            
-            chunks = splitter.split_text(doc.page_content)
-            
-            # Create documents with metadata
-            documents = []
-            for i, chunk in enumerate(chunks):
-                chunk = chunk.strip()
-                if len(chunk) < 50:  # Skip small chunks
-                    continue
-                    
-                documents.append({
-                    "content": chunk,
-                    "metadata": {
-                        **doc.metadata,
-                        "source": url,
-                        "chunk_id": i,
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-                })
+            # Parsing and splitting are CPU-bound; run them on another core
+            with self.metrics.span("chunk"):
+                documents = await aparse_and_chunk(html, url)
             
-            return documents
+            return documents, {
+                "url": url,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "content_hash": page_hash
+            }
             
         except Exception as e:
             logger.error(f"Error processing URL {url}: {str(e)}")
-            return None
+            return None, None
+
+    async def process_url(self, url: str) -> Optional[List[Dict]]:
+        """Process a single URL and extract content"""
+        documents, _ = await self._process_url(url)
+        return documents
+
+    def _deduplicate(self, documents: List[Dict]) -> List[Dict]:
+        """
+        Drop chunks whose content is already indexed, repeated in the batch or
+        claimed by another ingestion. The chunks kept stay claimed until passed
+        to ``_release`` once they are stored or abandoned
+        """
+        hashes = [content_hash(doc["content"]) for doc in documents]
+        # Chunks re-ingested with their page replace its stored ones rather than duplicating them
+        sources = {doc["metadata"].get("source") for doc in documents}
+        unique = []
+        # Checking the docstore and claiming in one step keeps concurrent jobs from both storing a chunk
+        with self._claims_lock:
+            stored = (
+                self.vector_store.docstore.existing_hashes(hashes, sources)
+                if self.vector_store is not None else set()
+            )
+            for doc, chunk_hash in zip(documents, hashes):
+                if chunk_hash in stored or chunk_hash in self._claimed_hashes:
+                    continue
+                self._claimed_hashes.add(chunk_hash)
+                unique.append(doc)
+        if len(unique) < len(documents):
+            logger.info(f"Skipped {len(documents) - len(unique)} duplicate chunks")
+        return unique
+
+    def _release(self, texts: List[str]):
+        """Drop the claims ``_deduplicate`` took on these chunk texts"""
+        with self._claims_lock:
+            self._claimed_hashes.difference_update(content_hash(text) for text in texts)
+
+    def ensure_vector_store(self) -> SegmentedVectorStore:
+        """The vector store, created empty at VECTOR_STORE_PATH if there is none yet"""
+        if self.vector_store is None:
+            if self._index_exists():
+                raise RuntimeError(f"The index at {VECTOR_STORE_PATH} could not be loaded; refusing to write a new one over it")
+            self.vector_store = SegmentedVectorStore(
+                self.embeddings,
+                VECTOR_STORE_PATH
+            )
+            self.vector_store.start_background_compaction()
+        if not self.vector_store.ntotal:
+            self.embeddings.save_index_metadata(VECTOR_STORE_PATH)
+        return self.vector_store
 
     async def process_domains(self, urls: List[str]) -> List[Dict]:
         """Process multiple URLs and update vector store"""
+        if not self.is_writer:
+            logger.warning(f"Not the index writer process; skipped ingesting {len(urls)} URLs")
+            return []
         try:
             # Process URLs concurrently
-            tasks = [self.process_url(url) for url in urls]
+            tasks = [self._process_url(url) for url in urls]
             results = await asyncio.gather(*tasks)
             
             # Flatten and filter results
             documents = []
-            for result in results:
+            records = []
+            for result, record in results:
                 if result:
                     documents.extend(result)
+                if record:
+                    records.append(record)
+            
+            # Only new content is embedded
+            with self.metrics.span("dedupe"):
+                documents = self._deduplicate(documents)
+            # A re-ingested page's new chunks replace all of its old ones
+            sources = [record["url"] for record in records]
             
             if documents:
                 # Create or update vector store
                 texts = [doc["content"] for doc in documents]
                 metadatas = [doc["metadata"] for doc in documents]
                 
-                if self.vector_store is None:
-                    self.vector_store = FAISS.from_texts(
-                        texts,
-                        self.embeddings,
-                        metadatas=metadatas
-                    )
-                else:
-                    self.vector_store.add_texts(
-                        texts,
-                        metadatas=metadatas
-                    )
-                
-                # Save updated vector store
-                self.save_vector_store()
+                try:
+                    self.ensure_vector_store()
+                    
+                    with self.metrics.span("embed"):
+                        embeddings = await self.embeddings.aembed_documents(texts)
+                    # Appends and persists a new segment; the rest of the index is untouched
+                    with self.metrics.span("save"):
+                        await asyncio.to_thread(
+                            self.vector_store.add_embeddings, texts, embeddings, metadatas, None, sources
+                        )
+                finally:
+                    self._release(texts)
+                self.index_version += 1
+            elif sources and self.vector_store is not None:
+                # Pages left without content lose their old chunks
+                if await asyncio.to_thread(self.vector_store.docstore.delete_sources, sources):
+                    self.index_version += 1
+                self.metrics.inc("docsgpt_ingested_chunks_total", len(documents), help="Chunks added to the index")
+            
+            # Pages count as ingested only once their chunks are stored
+            for record in records:
+                self.url_registry.record(**record)
             
             return documents
             
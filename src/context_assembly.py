@@ -0,0 +1,145 @@
+from typing import Callable, List, Optional, Sequence, Set
+import os
+import re
+import threading
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+from pydantic import Field
+from .docstore import STOPWORDS, TOKEN_PATTERN
+from .metrics import TOKEN_BUCKETS, get_metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+# Longest overlap looked for between consecutive chunks; the splitter uses 200 characters
+MAX_CHUNK_OVERLAP = 400
+
+_token_counter = None
+_token_counter_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken's cl100k_base, or an estimate of 4 characters per token"""
+    global _token_counter
+    if _token_counter is None:
+        with _token_counter_lock:
+            if _token_counter is None:
+                try:
+                    import tiktoken
+                    encoding = tiktoken.get_encoding(os.getenv('TOKENIZER_ENCODING', 'cl100k_base'))
+                    _token_counter = lambda text: len(encoding.encode(text, disallowed_special=()))
+                except Exception as e:
+                    # The encoding is downloaded on first use, which fails offline
+                    logger.warning(f"Tokenizer unavailable, estimating token counts: {str(e)}")
+                    _token_counter = lambda text: (len(text) + 3) // 4
+    return _token_counter(text)
+
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    words = [word.lower() for word in TOKEN_PATTERN.findall(text)]
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _overlap(first: str, second: str, min_overlap: int = 50) -> int:
+    """Length of the longest end of ``first`` that ``second`` starts with"""
+    tail = first[-MAX_CHUNK_OVERLAP:]
+    probe = second[:min_overlap]
+    if len(probe) < min_overlap:
+        return 0
+    start = tail.find(probe)
+    while start != -1:
+        if second.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def _strip_overlap(other: str, text: str) -> str:
+    """``text`` without the part it shares with a neighbouring chunk ``other`` of the same page"""
+    if overlap := _overlap(other, text):
+        return text[overlap:].lstrip()
+    if overlap := _overlap(text, other):
+        return text[:-overlap].rstrip()
+    return text
+
+
+class ContextAssembler(BaseDocumentCompressor):
+    """Builds the answer prompt's context from retrieved chunks within a token budget.
+
+    Chunks are taken in retrieval order. Near-duplicates (word-trigram Jaccard
+    similarity at or above ``duplicate_threshold``) are dropped, the text a chunk
+    repeats from an earlier chunk of the same page (the splitter's overlap) is
+    cut, and with ``extract_sentences`` only the sentences sharing terms with the
+    question are kept. Chunks are then added until ``max_tokens`` is reached.
+    """
+
+    max_tokens: int = Field(default_factory=lambda: int(os.getenv('CONTEXT_MAX_TOKENS', 3000)))
+    duplicate_threshold: float = Field(default_factory=lambda: float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', 0.8)))
+    extract_sentences: bool = Field(
+        default_factory=lambda: os.getenv('CONTEXT_EXTRACT_SENTENCES', 'false').lower() == 'true'
+    )
+    max_sentences: int = Field(default_factory=lambda: int(os.getenv('CONTEXT_MAX_SENTENCES', 6)))
+    token_counter: Callable[[str], int] = count_tokens
+
+    def _relevant_sentences(self, text: str, query: str) -> str:
+        """The chunk's sentences sharing the most terms with the query, in their original order"""
+        terms = {term.lower() for term in TOKEN_PATTERN.findall(query)} - STOPWORDS
+        sentences = [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+        if not terms or len(sentences) <= self.max_sentences:
+            return text
+        scores = [
+            len(terms & {word.lower() for word in TOKEN_PATTERN.findall(sentence)})
+            for sentence in sentences
+        ]
+        ranked = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+        keep = sorted(i for i in ranked[:self.max_sentences] if scores[i] > 0)
+        if not keep:
+            return text
+        return " ".join(sentences[i] for i in keep)
+
+    def compress_documents(self,
+                           documents: Sequence[Document],
+                           query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        kept: List[Document] = []
+        kept_texts: List[str] = []
+        kept_shingles: List[Set[str]] = []
+        used_tokens = 0
+        for doc in documents:
+            shingles = _shingles(doc.page_content)
+            if any(
+                len(shingles & other) / len(shingles | other) >= self.duplicate_threshold
+                for other in kept_shingles
+            ):
+                continue
+
+            text = doc.page_content
+            for previous, previous_text in zip(kept, kept_texts):
+                if previous.metadata.get("source") == doc.metadata.get("source"):
+                    text = _strip_overlap(previous_text, text)
+            if not text:
+                continue
+
+            if self.extract_sentences:
+                text = self._relevant_sentences(text, query)
+            tokens = self.token_counter(text)
+            if used_tokens + tokens > self.max_tokens:
+                # A smaller chunk further down may still fit
+                continue
+            kept.append(Document(id=doc.id, page_content=text, metadata={**doc.metadata, "tokens": tokens}))
+            kept_texts.append(doc.page_content)
+            kept_shingles.append(shingles)
+            used_tokens += tokens
+
+        get_metrics().observe(
+            "docsgpt_context_tokens",
+            used_tokens,
+            help="Tokens of retrieved context put into each answer prompt",
+            buckets=TOKEN_BUCKETS
+        )
+        if len(kept) < len(documents):
+            logger.info(f"Context assembly kept {len(kept)} of {len(documents)} chunks ({used_tokens} tokens)")
+        return kept
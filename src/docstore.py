@@ -0,0 +1,347 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import contextlib
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.documents import Document
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Underscores stay inside tokens so identifiers like ERR_CONNECTION_RESET match whole
+FTS_TOKENIZER = "unicode61 tokenchars '_'"
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Metadata fields with inverted lists (field, value) -> row ids for pre-filtering
+INDEXED_METADATA_FIELDS = ("source", "domain", "title", "language")
+STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from how i if in is it of on or
+    that the this to use using what when where which why with you your
+""".split())
+
+
+def content_hash(text: str) -> str:
+    """Hash of a chunk's text with whitespace normalised, used for deduplication"""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class SQLiteDocstore:
+    """Document text and metadata kept on disk and fetched by integer row id.
+
+    Vector segments only store row ids, so a search reads the few rows of its
+    top hits instead of the whole corpus being unpickled into memory. Each thread
+    gets its own connection; WAL mode keeps readers from blocking the writer.
+
+    An FTS5 table alongside the documents is the lexical (BM25) index, and a
+    postings table maps values of ``INDEXED_METADATA_FIELDS`` to row ids so
+    filtered searches can pick their candidates before the vector search. Both
+    are written in the same transaction as the documents, so they are always in sync.
+
+    Row ids come from a persisted counter and are never reused: the vectors of a
+    replaced document keep pointing at its old, now missing, row rather than at
+    whichever document is stored next.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or ":memory:"
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # An in-memory database only exists on the connection that created it
+        self._shared = self.path == ":memory:"
+        self._shared_lock = threading.RLock()
+        self._shared_connection = None
+        with self._lock():
+            conn = self._connection()
+            if not self._shared:
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    rowid INTEGER PRIMARY KEY,
+                    doc_id TEXT UNIQUE NOT NULL,
+                    page_content TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            # Stores written before the counter existed continue after their highest row id
+            conn.execute(
+                "INSERT OR IGNORE INTO counters (name, value) "
+                "SELECT 'next_rowid', COALESCE(MAX(rowid), 0) + 1 FROM documents"
+            )
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS content_hashes (
+                    hash TEXT PRIMARY KEY,
+                    rowid INTEGER NOT NULL
+                )
+            """)
+            has_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'"
+            ).fetchone()
+            if not has_fts:
+                conn.execute(
+                    f"CREATE VIRTUAL TABLE documents_fts USING fts5(page_content, content='', "
+                    f"tokenize=\"{FTS_TOKENIZER}\")"
+                )
+                # Index documents stored before the lexical index existed
+                conn.execute("INSERT INTO documents_fts (rowid, page_content) SELECT rowid, page_content FROM documents")
+            has_postings = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'metadata_postings'"
+            ).fetchone()
+            if not has_postings:
+                conn.execute("""
+                    CREATE TABLE metadata_postings (
+                        field TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        rowid INTEGER NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX metadata_postings_lookup ON metadata_postings (field, value, rowid)")
+                rows = conn.execute("SELECT rowid, metadata FROM documents")
+                conn.executemany(
+                    "INSERT INTO metadata_postings (field, value, rowid) VALUES (?, ?, ?)",
+                    [
+                        posting
+                        for rowid, metadata in rows.fetchall()
+                        for posting in self._postings(rowid, json.loads(metadata))
+                    ]
+                )
+            conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._shared:
+            if self._shared_connection is None:
+                self._shared_connection = sqlite3.connect(self.path, check_same_thread=False)
+            return self._shared_connection
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _postings(rowid: int, metadata: Dict) -> List[Tuple[str, str, int]]:
+        """(field, value, row id) entries for the indexed scalar metadata fields"""
+        return [
+            (field, json.dumps(metadata[field]), int(rowid))
+            for field in INDEXED_METADATA_FIELDS
+            if isinstance(metadata.get(field), (str, int, float, bool))
+        ]
+
+    def _lock(self):
+        return self._shared_lock if self._shared else contextlib.nullcontext()
+
+    def __len__(self) -> int:
+        with self._lock():
+            return self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    @staticmethod
+    def _delete_rows(conn: sqlite3.Connection, rows: List[Tuple[int, str]]):
+        """Delete (row id, text) documents along with their FTS entries, postings and hashes"""
+        if not rows:
+            return
+        # A contentless FTS5 table is told the old text to remove its terms
+        conn.executemany(
+            "INSERT INTO documents_fts (documents_fts, rowid, page_content) VALUES ('delete', ?, ?)",
+            rows
+        )
+        for table in ("metadata_postings", "content_hashes", "documents"):
+            conn.executemany(f"DELETE FROM {table} WHERE rowid = ?", [(rowid,) for rowid, _ in rows])
+
+    def _delete_documents(self, conn: sqlite3.Connection, doc_ids: List[str]):
+        """Delete the stored documents with these ids"""
+        for start in range(0, len(doc_ids), 500):
+            batch = doc_ids[start:start + 500]
+            self._delete_rows(conn, conn.execute(
+                f"SELECT rowid, page_content FROM documents WHERE doc_id IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall())
+
+    def _delete_sources(self, conn: sqlite3.Connection, sources: List[str]) -> int:
+        """Delete every stored document whose ``source`` is one of ``sources``; returns how many"""
+        deleted = 0
+        for start in range(0, len(sources), 500):
+            batch = [json.dumps(source) for source in sources[start:start + 500]]
+            rows = conn.execute(
+                f"SELECT d.rowid, d.page_content FROM metadata_postings p JOIN documents d ON d.rowid = p.rowid "
+                f"WHERE p.field = 'source' AND p.value IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall()
+            self._delete_rows(conn, rows)
+            deleted += len(rows)
+        return deleted
+
+    def delete_sources(self, sources: Iterable[str]) -> int:
+        """Delete the documents of these pages; returns how many were stored"""
+        with self._write_lock, self._lock():
+            conn = self._connection()
+            with conn:
+                return self._delete_sources(conn, list(sources))
+
+    def add(self,
+            ids: List[str],
+            texts: List[str],
+            metadatas: List[Dict],
+            replace_sources: Iterable[str] = ()) -> np.ndarray:
+        """
+        Store documents and return the row ids assigned to them. A document whose id
+        is already stored replaces it under a new row id, and the documents of
+        ``replace_sources`` (pages being re-ingested) are deleted in the same transaction
+        """
+        with self._write_lock, self._lock():
+            conn = self._connection()
+            with conn:
+                self._delete_sources(conn, list(replace_sources))
+                self._delete_documents(conn, ids)
+                start = conn.execute("SELECT value FROM counters WHERE name = 'next_rowid'").fetchone()[0]
+                conn.execute("UPDATE counters SET value = ? WHERE name = 'next_rowid'", (start + len(ids),))
+                rowids = np.arange(start, start + len(ids), dtype=np.int64)
+                conn.executemany(
+                    "INSERT INTO documents (rowid, doc_id, page_content, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (int(rowid), doc_id, text, json.dumps(metadata))
+                        for rowid, doc_id, text, metadata in zip(rowids, ids, texts, metadatas)
+                    ]
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO content_hashes (hash, rowid) VALUES (?, ?)",
+                    [(content_hash(text), int(rowid)) for rowid, text in zip(rowids, texts)]
+                )
+                conn.executemany(
+                    "INSERT INTO documents_fts (rowid, page_content) VALUES (?, ?)",
+                    [(int(rowid), text) for rowid, text in zip(rowids, texts)]
+                )
+                conn.executemany(
+                    "INSERT INTO metadata_postings (field, value, rowid) VALUES (?, ?, ?)",
+                    [
+                        posting
+                        for rowid, metadata in zip(rowids, metadatas)
+                        for posting in self._postings(rowid, metadata)
+                    ]
+                )
+        return rowids
+
+    @staticmethod
+    def is_indexed_filter(filter: Dict) -> bool:
+        """Whether every ``field == value`` of the filter can be answered from the postings"""
+        return bool(filter) and all(
+            field in INDEXED_METADATA_FIELDS and isinstance(value, (str, int, float, bool))
+            for field, value in filter.items()
+        )
+
+    def filter_is_broad(self, filter: Dict, min_rows: int) -> bool:
+        """Whether each field of an indexed filter matches at least ``min_rows`` documents, counting no further"""
+        with self._lock():
+            conn = self._connection()
+            return all(
+                conn.execute(
+                    "SELECT COUNT(*) FROM (SELECT 1 FROM metadata_postings WHERE field = ? AND value = ? LIMIT ?)",
+                    (field, json.dumps(value), min_rows)
+                ).fetchone()[0] >= min_rows
+                for field, value in filter.items()
+            )
+
+    def filter_rowids(self, filter: Dict) -> Optional[np.ndarray]:
+        """
+        Sorted row ids of documents matching every ``field == value`` in the filter,
+        or None when the filter uses a field without postings
+        """
+        if not self.is_indexed_filter(filter):
+            return None
+        query = " INTERSECT ".join(
+            "SELECT rowid FROM metadata_postings WHERE field = ? AND value = ?" for _ in filter
+        )
+        params = [item for field, value in filter.items() for item in (field, json.dumps(value))]
+        with self._lock():
+            rows = self._connection().execute(f"{query} ORDER BY rowid", params).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    @staticmethod
+    def _match_expression(query: str) -> Optional[str]:
+        """FTS5 query matching any of the query's terms, ignoring common stopwords"""
+        terms = [term.lower() for term in TOKEN_PATTERN.findall(query)]
+        keywords = [term for term in terms if term not in STOPWORDS] or terms
+        if not keywords:
+            return None
+        return " OR ".join(f'"{term}"' for term in dict.fromkeys(keywords))
+
+    def keyword_search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """BM25 search returning (row id, score) pairs, best first; higher scores are better"""
+        expression = self._match_expression(query)
+        if expression is None:
+            return []
+        with self._lock():
+            rows = self._connection().execute(
+                "SELECT rowid, bm25(documents_fts) AS score FROM documents_fts "
+                "WHERE documents_fts MATCH ? ORDER BY score LIMIT ?",
+                (expression, k)
+            ).fetchall()
+        # FTS5 reports BM25 negated so that ascending order is best first
+        return [(rowid, -score) for rowid, score in rows]
+
+    def existing_hashes(self, hashes: Iterable[str], exclude_sources: Iterable[str] = ()) -> Set[str]:
+        """
+        Subset of the given content hashes that are already stored, not counting
+        documents of ``exclude_sources`` (pages about to be replaced)
+        """
+        hashes = list(hashes)
+        excluded = {json.dumps(source) for source in exclude_sources}
+        existing = set()
+        with self._lock():
+            conn = self._connection()
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT h.hash, p.value FROM content_hashes h "
+                    f"LEFT JOIN metadata_postings p ON p.rowid = h.rowid AND p.field = 'source' "
+                    f"WHERE h.hash IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                existing.update(chunk_hash for chunk_hash, source in rows if source not in excluded)
+        return existing
+
+    def contains(self, rowids: np.ndarray) -> np.ndarray:
+        """Boolean mask of the row ids whose document is still stored"""
+        if not len(rowids):
+            return np.zeros(0, dtype=bool)
+        with self._lock():
+            # Row ids of a segment are one ascending run, so a range scan beats batches of IN lists
+            rows = self._connection().execute(
+                "SELECT rowid FROM documents WHERE rowid BETWEEN ? AND ?",
+                (int(np.min(rowids)), int(np.max(rowids)))
+            ).fetchall()
+        return np.isin(rowids, np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+
+    def get(self, rowids: Iterable[int]) -> Dict[int, Document]:
+        """Fetch documents by row id; ids whose document was replaced are omitted"""
+        rowids = [int(rowid) for rowid in rowids]
+        documents = {}
+        with self._lock():
+            conn = self._connection()
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(rowids), 500):
+                batch = rowids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT rowid, doc_id, page_content, metadata FROM documents "
+                    f"WHERE rowid IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                for rowid, doc_id, page_content, metadata in rows:
+                    documents[rowid] = Document(
+                        id=doc_id,
+                        page_content=page_content,
+                        metadata=json.loads(metadata)
+                    )
+        return documents
+
+    def close(self):
+        conn = self._shared_connection if self._shared else getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+
@@ -0,0 +1,216 @@
+from typing import List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import re
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+LOCAL_EMBEDDING_MODEL = "local-hashing"
+EMBEDDING_PROVIDERS = ("huggingface", "local")
+INDEX_METADATA_FILE = "embedding.json"
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class LocalEmbeddings(Embeddings):
+    """Offline stand-in for the embedding model, for tests and benchmarks.
+
+    Hashes each lower-cased word into one of ``dimension`` buckets and normalises
+    the counts, so texts sharing words land close together and retrieval behaves
+    plausibly. ``latency`` seconds are added per batch to mimic a forward pass.
+    """
+
+    def __init__(self, dimension: int = 768, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in _WORD_PATTERN.findall(text.lower()):
+            bucket = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            vector[bucket % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingService(Embeddings):
+    """Process-wide embedding model with micro-batching of concurrent calls.
+
+    Every ``embed_query``/``embed_documents`` call (sync or async) is queued to a
+    single encoder thread, which groups whatever arrived within
+    ``EMBEDDING_BATCH_WAIT_MS`` into one forward pass of up to
+    ``EMBEDDING_BATCH_SIZE`` texts. The underlying model is only loaded on the
+    first request (or an explicit ``warm_up``). ``EMBEDDING_PROVIDER=local``
+    swaps the model for ``LocalEmbeddings``.
+    """
+
+    def __init__(self,
+                 model_name: Optional[str] = None,
+                 batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        self.provider = os.getenv('EMBEDDING_PROVIDER', 'huggingface').lower()
+        if self.provider not in EMBEDDING_PROVIDERS:
+            raise ValueError(f"Unknown embedding provider {self.provider}, "
+                             f"expected one of {', '.join(EMBEDDING_PROVIDERS)}")
+        # A different name keeps local vectors from being mixed into a real model's index
+        default_model = LOCAL_EMBEDDING_MODEL if self.provider == "local" else DEFAULT_EMBEDDING_MODEL
+        self.model_name = model_name or os.getenv('EMBEDDING_MODEL', default_model)
+        self.batch_size = int(batch_size or os.getenv('EMBEDDING_BATCH_SIZE', 32))
+        self.max_wait = float(max_wait_ms if max_wait_ms is not None
+                              else os.getenv('EMBEDDING_BATCH_WAIT_MS', 5)) / 1000
+        self._model = None
+        self._dimension = None
+        self._load_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Underlying embedding model, loaded on first use"""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None and self.provider == "local":
+                    self._model = LocalEmbeddings(
+                        dimension=int(os.getenv('LOCAL_EMBEDDING_DIMENSION', 768)),
+                        latency=float(os.getenv('LOCAL_EMBEDDING_LATENCY_MS', 0)) / 1000
+                    )
+                elif self._model is None:
+                    from langchain.embeddings import HuggingFaceEmbeddings
+                    start = time.perf_counter()
+                    self._model = HuggingFaceEmbeddings(
+                        model_name=self.model_name,
+                        encode_kwargs={"batch_size": self.batch_size}
+                    )
+                    logger.info(f"Loaded embedding model {self.model_name} "
+                                f"in {time.perf_counter() - start:.2f}s")
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        """Embedding dimension of the loaded model"""
+        if self._dimension is None:
+            self._dimension = len(self.embed_query("dimension probe"))
+        return self._dimension
+
+    def warm_up(self):
+        """Load the model and start the encoder thread ahead of the first request"""
+        self._ensure_worker()
+        return self.dimension
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(
+                        target=self._run, name="embedding-service", daemon=True
+                    )
+                    self._worker.start()
+
+    def _run(self):
+        """Encoder loop: drain the queue into batches and run one forward pass per batch"""
+        while True:
+            requests = [self._queue.get()]
+            size = len(requests[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            # Drop requests whose callers gave up; the rest can no longer be cancelled
+            requests = [r for r in requests if r[1].set_running_or_notify_cancel()]
+            if not requests:
+                continue
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                vectors = self.model.embed_documents(texts)
+            except Exception as e:
+                logger.error(f"Error embedding batch of {len(texts)} texts: {str(e)}")
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, future in requests:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    def _submit(self, texts: List[str]) -> Future:
+        future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        self._ensure_worker()
+        self._queue.put((list(texts), future))
+        return future
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._submit(texts).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text]).result()[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._submit(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vectors = await asyncio.wrap_future(self._submit([text]))
+        return vectors[0]
+
+    def save_index_metadata(self, path: str):
+        """Record which model produced the vectors stored at ``path``"""
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, INDEX_METADATA_FILE), "w") as f:
+            json.dump({"model_name": self.model_name, "dimension": self.dimension}, f)
+
+    def matches_index(self, path: str) -> bool:
+        """Check that the index at ``path`` was built with this model"""
+        metadata_path = os.path.join(path, INDEX_METADATA_FILE)
+        if not os.path.exists(metadata_path):
+            # Indexes written before the model was recorded used the default model
+            return self.model_name == DEFAULT_EMBEDDING_MODEL
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        if metadata.get("model_name") != self.model_name:
+            logger.error(f"Index at {path} was built with {metadata.get('model_name')}, "
+                         f"but the embedding model is {self.model_name}")
+            return False
+        return True
+
+
+_embedding_service = None
+_embedding_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Return the embedding service shared by the whole process"""
+    global _embedding_service
+    if _embedding_service is None:
+        with _embedding_service_lock:
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService()
+    return _embedding_service
@@ -0,0 +1,141 @@
+from typing import Dict, Optional
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (compatible; DocsGPT/1.0)'
+
+
+class ResponseTooLarge(Exception):
+    """Raised when a response body exceeds the fetcher's size limit"""
+
+
+class _LoopState:
+    """Connection pool and per-host limiters bound to one event loop"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.host_locks: Dict[str, asyncio.Lock] = {}
+        self.host_next_request: Dict[str, float] = {}
+
+
+class AsyncFetcher:
+    """Shared async HTTP fetcher for document loading.
+
+    Reuses pooled keep-alive connections (HTTP/2 when the ``h2`` package is
+    installed), limits concurrent requests and request rate per host, applies a
+    timeout to every request and aborts bodies larger than ``max_bytes`` so one
+    slow or huge page cannot hold up a whole ingestion batch.
+    """
+
+    def __init__(self,
+                 timeout: Optional[float] = None,
+                 max_bytes: Optional[int] = None,
+                 per_host_concurrency: Optional[int] = None,
+                 per_host_rps: Optional[float] = None,
+                 max_connections: Optional[int] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.timeout = timeout or float(os.getenv('FETCH_TIMEOUT_SECONDS', 10))
+        self.max_bytes = max_bytes or int(float(os.getenv('FETCH_MAX_MB', 5)) * 1024 * 1024)
+        self.per_host_concurrency = per_host_concurrency or int(os.getenv('FETCH_PER_HOST_CONCURRENCY', 4))
+        rps = per_host_rps if per_host_rps is not None else float(os.getenv('FETCH_PER_HOST_RPS', 0))
+        self.min_interval = 1.0 / rps if rps > 0 else 0.0
+        self.max_connections = max_connections or int(os.getenv('FETCH_MAX_CONNECTIONS', 100))
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self._transport = transport
+        # httpx clients cannot be shared between event loops
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            client = httpx.AsyncClient(
+                http2=self.http2 and self._transport is None,
+                transport=self._transport,
+                follow_redirects=True,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections // 4 or 1
+                ),
+                headers={"User-Agent": os.getenv('USER_AGENT', DEFAULT_USER_AGENT)}
+            )
+            state = _LoopState(client)
+            self._states[loop] = state
+        return state
+
+    async def _wait_for_rate_limit(self, state: _LoopState, host: str):
+        if not self.min_interval:
+            return
+        lock = state.host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            delay = state.host_next_request.get(host, 0.0) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            state.host_next_request[host] = time.monotonic() + self.min_interval
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict:
+        """
+        Fetch a URL and return {"url", "status", "text", "headers"}, with headers
+        as case-insensitive httpx.Headers. A 304 response has empty text; other
+        non-2xx statuses raise httpx.HTTPStatusError
+        """
+        state = self._state()
+        host = urlsplit(url).netloc
+        semaphore = state.host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+        async with semaphore:
+            await self._wait_for_rate_limit(state, host)
+            # Bound the whole exchange, not just each socket operation
+            return await asyncio.wait_for(self._get(state.client, url, headers), self.timeout)
+
+    async def _get(self, client: httpx.AsyncClient, url: str, headers: Optional[Dict[str, str]]) -> Dict:
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                return {"url": str(response.url), "status": 304, "text": "", "headers": response.headers}
+            response.raise_for_status()
+
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                raise ResponseTooLarge(f"{url} is {length} bytes, limit is {self.max_bytes}")
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    raise ResponseTooLarge(f"{url} exceeds {self.max_bytes} bytes")
+
+            return {
+                "url": str(response.url),
+                "status": response.status_code,
+                "text": body.decode(response.encoding or "utf-8", errors="replace"),
+                "headers": response.headers
+            }
+
+    async def aclose(self):
+        """Close the connection pool of the running event loop"""
+        state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state.client.aclose()
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> AsyncFetcher:
+    """Return the fetcher shared by the whole process"""
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = AsyncFetcher()
+    return _fetcher
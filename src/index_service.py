@@ -0,0 +1,154 @@
+from typing import List, Optional
+import os
+import secrets
+import threading
+from multiprocessing.connection import Client, Connection, Listener, families
+from .embedding_service import EmbeddingService
+import logging
+
+logger = logging.getLogger(__name__)
+
+WRITER_LOCK_FILE = "writer.lock"
+EMBEDDING_SOCKET_FILE = "embedding.sock"
+EMBEDDING_KEY_FILE = "embedding.key"
+# The embedding server needs Unix domain sockets, which e.g. Windows lacks
+UNIX_SOCKETS = "AF_UNIX" in families
+
+
+class WriterLock:
+    """Advisory lock electing the one process on the host that writes the index.
+
+    Held for the life of the process and released by the OS if it dies, so
+    another process can take over. Platforms without ``fcntl`` always win the
+    election and therefore only support a single process per index.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.join(path, WRITER_LOCK_FILE)
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        """Take the lock without blocking; True if this process is (now) the writer"""
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        try:
+            import fcntl
+        except ImportError:
+            self._file = open(self.path, "a")
+            return True
+        f = open(self.path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+
+def _authkey(path: str, create: bool) -> Optional[bytes]:
+    """Shared secret for the embedding socket, readable only by the service's user"""
+    key_path = os.path.join(path, EMBEDDING_KEY_FILE)
+    if create:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    if not os.path.exists(key_path):
+        return None
+    with open(key_path) as f:
+        return f.read().strip().encode()
+
+
+class EmbeddingServer:
+    """Serves the writer process's EmbeddingService to the other workers over a Unix socket.
+
+    Each connection gets a thread; requests from all of them still meet in the
+    service's micro-batching queue, so concurrent queries from different workers
+    share forward passes of the single loaded model.
+    """
+
+    def __init__(self, service: EmbeddingService, path: str):
+        self.service = service
+        self.address = os.path.join(path, EMBEDDING_SOCKET_FILE)
+        self.path = path
+        self._listener = None
+
+    def start(self):
+        if self._listener is not None:
+            return
+        if os.path.exists(self.address):
+            # Left behind by a writer that died
+            os.remove(self.address)
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=_authkey(self.path, create=True))
+        threading.Thread(target=self._accept, name="embedding-server", daemon=True).start()
+        logger.info(f"Serving embeddings on {self.address}")
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                logger.warning(f"Rejected embedding client: {str(e)}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: Connection):
+        with conn:
+            while True:
+                try:
+                    texts = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    conn.send(("ok", self.service.embed_documents(texts)))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+
+
+class _RemoteModel:
+    """Stands in for the HuggingFace model, forwarding batches to the EmbeddingServer"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(
+                os.path.join(self.path, EMBEDDING_SOCKET_FILE),
+                family="AF_UNIX",
+                authkey=_authkey(self.path, create=False)
+            )
+            self._local.conn = conn
+        return conn
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            conn = self._connection()
+            conn.send(list(texts))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # The writer restarted; reconnect on the next batch
+            self._local.conn = None
+            raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding server error: {result}")
+        return result
+
+
+class RemoteEmbeddingService(EmbeddingService):
+    """EmbeddingService for reader workers that embeds through the writer's model.
+
+    Calls are still micro-batched locally, so a worker sends one request per
+    batch rather than per query, and no model weights are loaded in this process.
+    """
+
+    def __init__(self, path: str, model_name: Optional[str] = None):
+        super().__init__(model_name)
+        self._model = _RemoteModel(path)
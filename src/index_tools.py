@@ -0,0 +1,169 @@
+"""Offline vector index maintenance.
+
+    python -m src.index_tools rebuild --index-type hnsw
+    python -m src.index_tools report --index-type ivf_flat --nprobe 1,4,16,64
+"""
+from typing import Dict, List, Optional, Tuple
+import argparse
+import time
+import faiss
+import numpy as np
+from .ann_index import INDEX_TYPES, IndexConfig
+from .content_ingestion import VECTOR_STORE_PATH
+from .embedding_service import get_embedding_service
+from .index_service import WriterLock
+from .vector_store import SegmentedVectorStore
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _index_config(args: argparse.Namespace, base: IndexConfig, **overrides) -> IndexConfig:
+    """``base`` (the store's current config) with the parameters given on the command line"""
+    params = base.to_dict()
+    given = {
+        "index_type": args.index_type,
+        "min_segment_size": args.min_segment_size,
+        "hnsw_m": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+        "nlist": args.nlist,
+        "pq_m": args.pq_m,
+        "pq_bits": args.pq_bits,
+        **overrides
+    }
+    params.update((key, value) for key, value in given.items() if value is not None)
+    return IndexConfig(**params)
+
+
+def _build_key(config: IndexConfig) -> Tuple:
+    """The parameters that shape a built index, leaving out the search-time knobs"""
+    return tuple(
+        (key, value) for key, value in sorted(config.to_dict().items()) if key not in ("ef_search", "nprobe")
+    )
+
+
+def _latencies_ms(search, queries: np.ndarray, k: int) -> List[float]:
+    """Per-query latency, searching one query at a time as the API does"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query[np.newaxis], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def _report_row(name: str, latencies: List[float], recall: float) -> Dict:
+    return {
+        "index": name,
+        "recall": recall,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95))
+    }
+
+
+def recall_latency_report(store: SegmentedVectorStore,
+                          configs: List[IndexConfig],
+                          queries: int = 200,
+                          k: int = 10,
+                          seed: int = 0) -> List[Dict]:
+    """
+    Recall@k and per-query latency of each index config against exact flat search.
+    A sample of stored vectors is held out of the indexes and used as the queries,
+    so no query finds itself. Configs differing only in ``ef_search``/``nprobe``
+    share one built index
+    """
+    vectors = np.concatenate([segment.vectors for segment in store.segments]).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[rng.choice(len(vectors), size=min(queries, len(vectors) // 2), replace=False)] = True
+    sample, vectors = vectors[held_out], vectors[~held_out]
+    _, truth = faiss.knn(sample, vectors, k)
+    truth = [set(row[row >= 0].tolist()) for row in truth]
+
+    rows = [_report_row("flat", _latencies_ms(lambda query, k: faiss.knn(query, vectors, k), sample, k), 1.0)]
+    built: Dict[Tuple, Optional[faiss.Index]] = {}
+    for config in configs:
+        name = config.index_type
+        if config.index_type == "hnsw":
+            name += f" efSearch={config.ef_search}"
+        elif config.index_type != "flat":
+            name += f" nprobe={config.nprobe}"
+        if len(vectors) < config.min_training_size:
+            rows.append({"index": name, "skipped": f"needs {config.min_training_size} vectors to train"})
+            continue
+        key = _build_key(config)
+        if key not in built:
+            built[key] = config.build(vectors)
+        index = built[key]
+        if index is None:
+            continue
+        config.tune(index)
+        _, indices = index.search(sample, k)
+        found = [set(row[row >= 0].tolist()) for row in indices]
+        recall = float(np.mean([len(hits & expected) / max(len(expected), 1)
+                                for hits, expected in zip(found, truth)]))
+        rows.append(_report_row(name, _latencies_ms(index.search, sample, k), recall))
+    return rows
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build and evaluate the vector store's ANN index")
+    parser.add_argument("command", choices=("rebuild", "report"))
+    parser.add_argument("--path", default=VECTOR_STORE_PATH)
+    parser.add_argument("--index-type", choices=INDEX_TYPES)
+    parser.add_argument("--min-segment-size", type=int)
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--ef-construction", type=int)
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--pq-m", type=int)
+    parser.add_argument("--pq-bits", type=int)
+    parser.add_argument("--ef-search", type=_int_list, default=[], help="Comma-separated values to sweep")
+    parser.add_argument("--nprobe", type=_int_list, default=[], help="Comma-separated values to sweep")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    # Rebuilding rewrites the segments and manifest, so it must not race a server's writer;
+    # the lock is held until the process exits
+    lock = WriterLock(args.path)
+    if args.command == "rebuild" and not lock.try_acquire():
+        parser.error(f"Another process writes the index at {args.path}; stop it first")
+    store = SegmentedVectorStore.load(args.path, get_embedding_service(), read_only=args.command == "report")
+    if not store.ntotal:
+        parser.error(f"No vectors stored at {args.path}")
+
+    if args.command == "rebuild":
+        # Parameters not given keep the values the store was built with
+        config = _index_config(
+            args,
+            store.index_config,
+            ef_search=args.ef_search[0] if args.ef_search else None,
+            nprobe=args.nprobe[0] if args.nprobe else None
+        )
+        start = time.perf_counter()
+        store.rebuild(config)
+        print(f"Rebuilt {store.ntotal} vectors as {config.index_type} in {time.perf_counter() - start:.1f}s")
+        return
+
+    # Every vector is searched through the index in the report, however small the store
+    configs = [
+        _index_config(args, store.index_config, min_segment_size=1, ef_search=ef_search, nprobe=nprobe)
+        for ef_search in args.ef_search or [None]
+        for nprobe in args.nprobe or [None]
+    ]
+    rows = recall_latency_report(store, configs, args.queries, args.k)
+    print(f"{'index':<28}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for row in rows:
+        if "skipped" in row:
+            print(f"{row['index']:<28}  skipped: {row['skipped']}")
+            continue
+        print(f"{row['index']:<28}{row['recall']:>10.3f}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
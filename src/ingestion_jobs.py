@@ -0,0 +1,271 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+# How often ``IngestionWorker.wait`` checks for jobs finished by another process
+JOB_STATUS_POLL_SECONDS = 0.5
+_JOB_COLUMNS = "id, query, urls, status, attempts, created_at, started_at, finished_at, result, error"
+
+
+class IngestionJobQueue:
+    """Persistent queue of ingestion jobs in SQLite.
+
+    A job ingests either a given list of URLs or the URLs found for a query.
+    Enqueueing a query that already has a queued or running job returns that job,
+    so a burst of identical misses triggers one ingestion. A running job whose
+    worker died is picked up again once it has run for ``job_timeout`` seconds,
+    and failed jobs are retried up to ``max_attempts`` times.
+    """
+
+    def __init__(self, path: str, job_timeout: Optional[float] = None, max_attempts: Optional[int] = None):
+        self.path = path
+        self.job_timeout = job_timeout or float(os.getenv('INGESTION_JOB_TIMEOUT_SECONDS', 600))
+        self.max_attempts = max_attempts or int(os.getenv('INGESTION_MAX_ATTEMPTS', 3))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                query TEXT,
+                urls TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @staticmethod
+    def _job(row) -> Dict:
+        return {
+            "id": row[0],
+            "query": row[1],
+            "urls": json.loads(row[2]) if row[2] else None,
+            "status": row[3],
+            "attempts": row[4],
+            "created_at": row[5],
+            "started_at": row[6],
+            "finished_at": row[7],
+            "result": json.loads(row[8]) if row[8] else None,
+            "error": row[9]
+        }
+
+    def enqueue(self, query: Optional[str] = None, urls: Optional[List[str]] = None) -> Dict:
+        """Add a job for ``urls``, or for URL discovery on ``query``, and return it"""
+        if not query and not urls:
+            raise ValueError("An ingestion job needs a query or URLs")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if query and not urls:
+                    row = self._conn.execute(
+                        f"SELECT {_JOB_COLUMNS} FROM jobs WHERE query = ? AND urls IS NULL "
+                        f"AND status IN ('queued', 'running') ORDER BY created_at LIMIT 1",
+                        (query,)
+                    ).fetchone()
+                    if row is not None:
+                        self._conn.execute("COMMIT")
+                        return self._job(row)
+                job_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO jobs (id, query, urls, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                    (job_id, query, json.dumps(urls) if urls else None, time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Most recent jobs first, optionally only those with ``status``"""
+        with self._lock:
+            if status:
+                rows = self._conn.execute(
+                    f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                    (status, limit)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    f"SELECT {_JOB_COLUMNS} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: dict(rows).get(status, 0) for status in JOB_STATUSES}
+
+    def claim(self) -> Optional[Dict]:
+        """Mark the oldest runnable job as running and return it, or None if there is none"""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes cannot claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status = 'queued' "
+                    f"OR (status = 'running' AND started_at < ?) ORDER BY created_at LIMIT 1",
+                    (now - self.job_timeout,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (now, row[0])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def complete(self, job_id: str, result: Dict):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, result = ?, error = NULL WHERE id = ?",
+                (time.time(), json.dumps(result), job_id)
+            )
+
+    def fail(self, job_id: str, error: str):
+        """Record a failed attempt, requeueing the job unless it is out of attempts"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "finished_at = ?, error = ? WHERE id = ?",
+                (self.max_attempts, time.time(), error, job_id)
+            )
+
+
+class IngestionWorker:
+    """Runs queued ingestion jobs on a pool of background tasks.
+
+    The workers live on their own event loop in a daemon thread, so slow fetches
+    and index writes never hold up the request loop. Fetching, parsing and
+    embedding already happen off-thread, so a few tasks keep a batch busy.
+    ``wait`` lets a request await a job's completion with a deadline. With
+    several processes sharing the queue, ``can_run`` limits claiming jobs to the
+    one that writes the index, and the others see completions by polling.
+    """
+
+    def __init__(self,
+                 queue: IngestionJobQueue,
+                 run_job: Callable[[Dict], Awaitable[Dict]],
+                 workers: Optional[int] = None,
+                 poll_interval: Optional[float] = None,
+                 can_run: Optional[Callable[[], bool]] = None):
+        self.queue = queue
+        self.run_job = run_job
+        self.can_run = can_run or (lambda: True)
+        self.workers = workers or int(os.getenv('INGESTION_WORKERS', 2))
+        self.poll_interval = poll_interval or float(os.getenv('INGESTION_POLL_SECONDS', 5))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._waiters_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        started = threading.Event()
+
+        async def run():
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            started.set()
+            await asyncio.gather(*(self._work() for _ in range(self.workers)))
+
+        self._thread = threading.Thread(target=lambda: asyncio.run(run()), name="ingestion-worker", daemon=True)
+        self._thread.start()
+        started.wait()
+        logger.info(f"Started {self.workers} ingestion workers")
+
+    def notify(self):
+        """Wake idle workers after a job was enqueued"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _work(self):
+        while True:
+            try:
+                # Queue updates are short SQLite writes; this loop serves no requests
+                job = self.queue.claim() if self.can_run() else None
+            except Exception as e:
+                logger.error(f"Error claiming ingestion job: {str(e)}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+
+            logger.info(f"Running ingestion job {job['id']} (attempt {job['attempts']})")
+            try:
+                result = await self.run_job(job)
+                self.queue.complete(job["id"], result)
+            except Exception as e:
+                logger.error(f"Ingestion job {job['id']} failed: {str(e)}")
+                self.queue.fail(job["id"], str(e))
+            self._resolve(job["id"])
+
+    def _resolve(self, job_id: str):
+        job = self.queue.get(job_id)
+        if job["status"] not in ("done", "failed"):
+            return
+        with self._waiters_lock:
+            waiters = self._waiters.pop(job_id, [])
+        for future in waiters:
+            future.get_loop().call_soon_threadsafe(
+                lambda future=future: future.done() or future.set_result(job)
+            )
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """The job once it is done or failed, or its current state after ``timeout`` seconds"""
+        future = asyncio.get_running_loop().create_future()
+        with self._waiters_lock:
+            self._waiters.setdefault(job_id, []).append(future)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                # The queue's connection lock can be held by a worker's write; keep it off the request loop
+                job = await asyncio.to_thread(self.queue.get, job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in ("done", "failed") or remaining <= 0:
+                    return job
+                try:
+                    # Jobs run by another process resolve no future here, so check back regularly
+                    return await asyncio.wait_for(asyncio.shield(future), min(remaining, JOB_STATUS_POLL_SECONDS))
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            with self._waiters_lock:
+                waiters = self._waiters.get(job_id, [])
+                if future in waiters:
+                    waiters.remove(future)
+                if not waiters:
+                    self._waiters.pop(job_id, None)
@@ -0,0 +1,365 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+import weakref
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDERS = ("groq", "local")
+# Rate limits, lock conflicts, timeouts and transient server errors
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class LocalChatModel(BaseChatModel):
+    """Offline stand-in for the LLM provider, for tests and benchmarks.
+
+    Answers with ``response`` if set, otherwise echoes the start of the last
+    message, after ``latency`` seconds. ``calls`` counts the requests it served.
+    """
+
+    response: Optional[str] = None
+    latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "local"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        self.calls += 1
+        if self.response is not None:
+            return self.response
+        return f"Local response to: {str(messages[-1].content)[:200]}"
+
+    @staticmethod
+    def _message(messages: List[BaseMessage], reply: str) -> AIMessage:
+        # Word counts stand in for token usage so metrics are populated offline
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(reply.split())
+        return AIMessage(content=reply, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        })
+
+    def _generate(self,
+                  messages: List[BaseMessage],
+                  stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None,
+                  **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, self._reply(messages)))])
+
+    async def _agenerate(self,
+                         messages: List[BaseMessage],
+                         stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                         **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, self._reply(messages)))])
+
+    async def _astream(self,
+                       messages: List[BaseMessage],
+                       stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in self._reply(messages).split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=f"{token} "))
+
+
+class GatewayChatModel(BaseChatModel):
+    """Chat model handed to chains; every call goes through the LLMGateway"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    gateway: Any
+    model: BaseChatModel
+    settings: Tuple
+    model_key: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gateway-{self.model._llm_type}"
+
+    @staticmethod
+    def _result(message: BaseMessage) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self,
+                  messages: List[BaseMessage],
+                  stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None,
+                  **kwargs: Any) -> ChatResult:
+        return self._result(self.gateway.invoke(self.model_key, self.model, messages, stop, kwargs))
+
+    async def _agenerate(self,
+                         messages: List[BaseMessage],
+                         stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                         **kwargs: Any) -> ChatResult:
+        model = self.gateway.async_model(self.settings)
+        return self._result(await self.gateway.ainvoke(self.model_key, model, messages, stop, kwargs))
+
+    async def _astream(self,
+                       messages: List[BaseMessage],
+                       stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self.gateway.astream(self.gateway.async_model(self.settings), messages, stop, kwargs):
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(str(chunk.content), chunk=generation)
+            yield generation
+
+
+class LLMGateway:
+    """Single access point to the LLM provider, shared by every component.
+
+    All chat models it hands out share one pooled HTTP client for blocking calls
+    and one per event loop for async calls. Calls are bounded
+    to ``max_concurrency`` in flight, retried with exponential backoff (honouring
+    ``Retry-After``) on rate limits and transient errors, and identical prompts
+    already in flight are coalesced so concurrent duplicates cost one LLM call.
+    Streaming calls are bounded and retried until their first token, but not coalesced.
+
+    ``LLM_PROVIDER=local`` swaps the provider for ``LocalChatModel``.
+    """
+
+    def __init__(self,
+                 provider: Optional[str] = None,
+                 max_concurrency: Optional[int] = None,
+                 max_retries: Optional[int] = None,
+                 backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None,
+                 timeout: Optional[float] = None,
+                 max_connections: Optional[int] = None):
+        self.provider = (provider or os.getenv('LLM_PROVIDER', 'groq')).lower()
+        if self.provider not in LLM_PROVIDERS:
+            raise ValueError(f"Unknown LLM provider {self.provider}, expected one of {', '.join(LLM_PROVIDERS)}")
+        self.max_concurrency = max_concurrency or int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LLM_MAX_RETRIES', 4))
+        self.backoff = backoff or float(os.getenv('LLM_BACKOFF_SECONDS', 0.5))
+        self.max_backoff = max_backoff or float(os.getenv('LLM_MAX_BACKOFF_SECONDS', 30))
+        self.timeout = timeout or float(os.getenv('LLM_TIMEOUT_SECONDS', 60))
+        max_connections = max_connections or int(os.getenv('LLM_MAX_CONNECTIONS', 20))
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._http_client = httpx.Client(limits=self._limits, timeout=self.timeout)
+        self._models: Dict[Tuple, BaseChatModel] = {}
+        self._models_lock = threading.Lock()
+        self._thread_semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        # asyncio primitives cannot be shared between event loops
+        self._loop_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        # Nor can pooled async connections, so async calls use models bound to their loop's client
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._loop_models: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, BaseChatModel]]" = weakref.WeakKeyDictionary()
+        self._inflight: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        # As reported by the provider in each response's usage metadata
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def chat_model(self,
+                   model_name: Optional[str] = None,
+                   temperature: float = 0.0,
+                   max_tokens: Optional[int] = None) -> GatewayChatModel:
+        """Chat model for ``model_name`` whose calls go through this gateway"""
+        key = (model_name, temperature, max_tokens)
+        with self._models_lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._create_model(model_name, temperature, max_tokens)
+                self._models[key] = model
+        return GatewayChatModel(gateway=self, model=model, settings=key, model_key=repr(key))
+
+    def async_model(self, settings: Tuple) -> BaseChatModel:
+        """The model for ``settings`` whose async client belongs to the running event loop"""
+        if self.provider == "local":
+            return self._models[settings]
+        loop = asyncio.get_running_loop()
+        with self._models_lock:
+            models = self._loop_models.get(loop)
+            if models is None:
+                models = self._loop_models[loop] = {}
+                self._loop_clients[loop] = httpx.AsyncClient(limits=self._limits, timeout=self.timeout)
+            model = models.get(settings)
+            if model is None:
+                # Models of one loop share its pool, as the blocking models share theirs
+                model = models[settings] = self._create_model(*settings, http_async_client=self._loop_clients[loop])
+        return model
+
+    def _create_model(self,
+                      model_name: Optional[str],
+                      temperature: float,
+                      max_tokens: Optional[int],
+                      http_async_client: Optional[httpx.AsyncClient] = None) -> BaseChatModel:
+        if self.provider == "local":
+            return LocalChatModel(
+                response=os.getenv('LOCAL_LLM_RESPONSE'),
+                latency=float(os.getenv('LOCAL_LLM_LATENCY_MS', 0)) / 1000
+            )
+        from langchain_groq import ChatGroq
+        return ChatGroq(
+            api_key=os.getenv('GROQ_API_KEY'),
+            model_name=model_name,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            # Retries are handled here so concurrent callers back off together
+            max_retries=0,
+            http_client=self._http_client,
+            http_async_client=http_async_client
+        )
+
+    @staticmethod
+    def _prompt_key(model_key: str, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict) -> str:
+        prompt = repr((model_key, [(m.type, m.content) for m in messages], stop, sorted(kwargs.items())))
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after ``error``, or None if it should be raised"""
+        if attempt >= self.max_retries:
+            return None
+        status = getattr(error, "status_code", None)
+        transient = isinstance(error, (httpx.TransportError, TimeoutError)) or \
+            type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+        if status not in RETRYABLE_STATUS_CODES and not transient:
+            return None
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), self.max_backoff)
+        except ValueError:
+            pass
+        # Full jitter keeps a burst of rate-limited callers from retrying in lockstep
+        return random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+
+    def _loop_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._loop_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop_semaphores[loop] = semaphore
+        return semaphore
+
+    def invoke(self,
+               model_key: str,
+               model: BaseChatModel,
+               messages: List[BaseMessage],
+               stop: Optional[List[str]],
+               kwargs: Dict) -> BaseMessage:
+        """Blocking call with bounded concurrency and retries"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._thread_semaphore:
+                    self.calls += 1
+                    return self._count_usage(model.invoke(messages, stop=stop, **kwargs))
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                self.retries += 1
+                logger.warning(f"LLM call failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    async def _ainvoke(self,
+                       model: BaseChatModel,
+                       messages: List[BaseMessage],
+                       stop: Optional[List[str]],
+                       kwargs: Dict) -> BaseMessage:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._loop_semaphore():
+                    self.calls += 1
+                    return self._count_usage(await model.ainvoke(messages, stop=stop, **kwargs))
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                self.retries += 1
+                logger.warning(f"LLM call failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def ainvoke(self,
+                      model_key: str,
+                      model: BaseChatModel,
+                      messages: List[BaseMessage],
+                      stop: Optional[List[str]],
+                      kwargs: Dict) -> BaseMessage:
+        """Async call that shares the result of an identical call already in flight"""
+        key = (id(asyncio.get_running_loop()), self._prompt_key(model_key, messages, stop, kwargs))
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(self._ainvoke(model, messages, stop, kwargs))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # One waiter being cancelled must not cancel the call for the others
+        return await asyncio.shield(future)
+
+    async def astream(self,
+                      model: BaseChatModel,
+                      messages: List[BaseMessage],
+                      stop: Optional[List[str]],
+                      kwargs: Dict) -> AsyncIterator[BaseMessage]:
+        """Stream message chunks, retrying only until the first chunk arrives"""
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self._loop_semaphore():
+                    self.calls += 1
+                    async for chunk in model.astream(messages, stop=stop, **kwargs):
+                        started = True
+                        yield self._count_usage(chunk)
+                return
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                self.retries += 1
+                logger.warning(f"LLM stream failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def _count_usage(self, message: BaseMessage) -> BaseMessage:
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+        return message
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Return the LLM gateway shared by the whole process"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
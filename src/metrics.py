@@ -0,0 +1,171 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds; searches run from milliseconds (cache hits) to tens of seconds (ingestion)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, labels, value) as reported by a collector at scrape time
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process counters, histograms and scrape-time gauges in the Prometheus text format.
+
+    ``span`` times a pipeline stage into ``docsgpt_stage_duration_seconds``.
+    Collectors registered with ``register_collector`` are called on every
+    ``render`` to report values that live elsewhere (cache and gateway
+    statistics, index size). Each worker process reports its own values.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self,
+                name: str,
+                value: float,
+                help: str = "",
+                buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(buckets)
+            histogram.observe(value)
+            if help:
+                self._help.setdefault(name, help)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """Record how long the block takes as one observation of ``stage``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(
+                "docsgpt_stage_duration_seconds",
+                elapsed,
+                help="Time spent in each search and ingestion stage",
+                stage=stage,
+                **labels
+            )
+            logger.debug(f"Stage {stage} took {elapsed * 1000:.1f}ms")
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+            help_texts = dict(self._help)
+            collectors = list(self._collectors)
+
+        lines = []
+        for name, series in sorted(counters.items()):
+            lines.append(f"# HELP {name} {help_texts.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# HELP {name} {help_texts.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (buckets, counts, total, count) in series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    bucket_key = key + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_key)} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        collected: Dict[str, Tuple[str, str, List[Tuple[Labels, float]]]] = {}
+        for collector in collectors:
+            try:
+                for name, kind, help_text, labels, value in collector():
+                    collected.setdefault(name, (kind, help_text, []))[2].append((_labels(labels), value))
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {str(e)}")
+        for name, (kind, help_text, samples) in sorted(collected.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in samples:
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """Return the metrics registry shared by the whole process"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
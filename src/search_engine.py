@@ -1,28 +1,66 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 import numpy as np
-from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 import os
 import asyncio
+from .embedding_service import get_embedding_service
+from .content_ingestion import VECTOR_STORE_PATH
+from .vector_store import SegmentedVectorStore
+from .cache import QueryCache
+from .llm_gateway import LLMGateway, get_llm_gateway
+from .metrics import get_metrics
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]],
+                           weights: Optional[List[float]] = None,
+                           rrf_k: int = RRF_K) -> List[Dict]:
+    """
+    Fuse ranked result lists by summing weight / (rrf_k + rank) per distinct
+    content. Ranks only, so scores on different scales (L2 distance, BM25) mix
+    safely. Returns results best first with the fused score in "score"
+    """
+    weights = weights or [1.0] * len(result_lists)
+    fused = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, result in enumerate(results, start=1):
+            key = result["content"]
+            if key not in fused:
+                fused[key] = {**result, "score": 0.0}
+            fused[key]["score"] += weight / (rrf_k + rank)
+    return sorted(fused.values(), key=lambda x: x["score"], reverse=True)
+
 
 class SearchEngine:
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-mpnet-base-v2"
-        )
-        self.vector_store = None
-        self.llm = ChatGroq(
-            api_key=os.getenv('GROQ_API_KEY'),
+    def __init__(self, content_ingestion=None, llm_gateway: Optional[LLMGateway] = None):
+        self.embeddings = get_embedding_service()
+        # Share the ingestion pipeline's vector store when given one
+        self.content_ingestion = content_ingestion
+        self._vector_store = None
+        self._index_version = 0
+        self.llm = (llm_gateway or get_llm_gateway()).chat_model(
             model_name=os.getenv('SUMMARY_MODEL'),
             temperature=float(os.getenv('SUMMARY_TEMPERATURE'))
         )
         self._setup_chains()
-        # Add result caching
-        self._query_cache = {}
-        self._expansion_cache = {}
+        # Search results are invalidated by index changes, expansions only expire
+        self._query_cache = QueryCache("query cache")
+        self._expansion_cache = QueryCache("expansion cache")
+        self.metrics = get_metrics()
+
+    @property
+    def vector_store(self):
+        if self.content_ingestion is not None:
+            return self.content_ingestion.vector_store
+        return self._vector_store
+
+    @property
+    def index_version(self) -> int:
+        if self.content_ingestion is not None:
+            return self.content_ingestion.index_version
+        return self._index_version
 
     def _setup_chains(self):
         """Setup LLM chains for query enhancement"""
@@ -43,19 +81,26 @@ class SearchEngine:
 
     async def _expand_query(self, query: str) -> List[str]:
         """Asynchronously expand the query"""
-        if query in self._expansion_cache:
-            return self._expansion_cache[query]
+        cached = self._expansion_cache.get(query)
+        if cached is not None:
+            return cached
             
         expanded = await self.query_expansion_chain.arun(query)
         queries = [q.strip() for q in expanded.strip().split(',')]
         queries.append(query)
-        self._expansion_cache[query] = queries
+        # Drop blank and repeated variants so each is only embedded and searched once
+        queries = list(dict.fromkeys(q for q in queries if q))
+        self._expansion_cache.set(query, queries)
         return queries
 
-    def load_vector_store(self, path: str = "faiss_index"):
+    def load_vector_store(self, path: str = VECTOR_STORE_PATH):
         """Load existing vector store"""
-        if os.path.exists(path):
-            self.vector_store = FAISS.load_local(path, self.embeddings)
+        if self.content_ingestion is not None:
+            # The ingestion pipeline owns loading and updating the shared store
+            return self.vector_store is not None
+        if os.path.exists(path) and self.embeddings.matches_index(path):
+            self._vector_store = SegmentedVectorStore.load(path, self.embeddings)
+            self._index_version += 1
             return True
         return False
 
@@ -66,24 +111,23 @@ class SearchEngine:
                 return []
                 
         # Check cache first
-        cache_key = f"{query}_{k}_{use_query_expansion}"
-        if cache_key in self._query_cache:
-            return self._query_cache[cache_key]
+        cache_key = (query, k, use_query_expansion)
+        version = self.index_version
+        cached = self._query_cache.get(cache_key, version=version)
+        if cached is not None:
+            return cached
 
-        results = []
         if use_query_expansion:
             # Generate alternative queries asynchronously
-            expanded_queries = await self._expand_query(query)
-            
-            # Search with each query in parallel
-            tasks = []
-            for q in expanded_queries:
-                tasks.append(self.vector_store.asimilarity_search_with_score(q, k=k//len(expanded_queries)))
-            
-            # Gather all results
-            all_results = await asyncio.gather(*tasks)
-            for q_results, q in zip(all_results, expanded_queries):
-                results.extend([
+            with self.metrics.span("query_expansion"):
+                expanded_queries = await self._expand_query(query)
+
+            # Embed every variant in one batch and search them in one index pass,
+            # each to the full depth k so fusion has overlap to work with
+            with self.metrics.span("vector_search"):
+                all_results = await self.vector_store.asimilarity_search_with_score_batch(expanded_queries, k=k)
+            result_lists = [
+                [
                     {
                         "content": doc.page_content,
                         "metadata": doc.metadata,
@@ -91,34 +135,39 @@ class SearchEngine:
                         "matched_query": q
                     }
                     for doc, score in q_results
-                ])
+                ]
+                for q_results, q in zip(all_results, expanded_queries)
+            ]
+
+            # Rank by fused rank across variants, reporting each result's closest match
+            with self.metrics.span("fusion"):
+                closest = {}
+                for result in (result for results in result_lists for result in results):
+                    if result["content"] not in closest or result["score"] < closest[result["content"]]["score"]:
+                        closest[result["content"]] = result
+                unique_results = [
+                    closest[result["content"]]
+                    for result in reciprocal_rank_fusion(result_lists)[:k]
+                ]
         else:
             # Direct search with original query
-            q_results = await self.vector_store.asimilarity_search_with_score(query, k=k)
-            results.extend([
-                {
+            with self.metrics.span("vector_search"):
+                q_results = await self.vector_store.asimilarity_search_with_score(query, k=k)
+            unique_results = []
+            seen = set()
+            for doc, score in q_results:
+                if doc.page_content in seen:
+                    continue
+                seen.add(doc.page_content)
+                unique_results.append({
                     "content": doc.page_content,
                     "metadata": doc.metadata,
                     "score": score,
                     "matched_query": query
-                }
-                for doc, score in q_results
-            ])
-
-        # Sort by score and remove duplicates
-        results.sort(key=lambda x: x["score"])
-        seen = set()
-        unique_results = []
-        for result in results:
-            content = result["content"]
-            if content not in seen:
-                seen.add(content)
-                unique_results.append(result)
-                if len(unique_results) >= k:
-                    break
+                })
                     
         # Cache results
-        self._query_cache[cache_key] = unique_results
+        self._query_cache.set(cache_key, unique_results, version=version)
         return unique_results
 
     def filtered_search(self, 
@@ -130,42 +179,37 @@ class SearchEngine:
             if not self.load_vector_store():
                 return []
 
-        # Get initial results
-        results = self.vector_store.similarity_search_with_score(query, k=k*2)  # Get more results for filtering
+        # The store narrows candidates with its metadata index before the vector search
+        results = self.vector_store.similarity_search_with_score(query, k=k, filter=filters)
         
-        # Apply filters
-        filtered_results = []
-        for doc, score in results:
-            matches_filters = all(
-                doc.metadata.get(key) == value 
-                for key, value in filters.items()
-            )
-            if matches_filters:
-                filtered_results.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "score": score
-                })
-                if len(filtered_results) >= k:
-                    break
+        filtered_results = [
+            {
+                "content": doc.page_content,
+                "metadata": doc.metadata,
+                "score": score
+            }
+            for doc, score in results
+        ]
                     
         return filtered_results
 
-    def hybrid_search(self,
-                     query: str,
-                     k: int = 5,
-                     semantic_weight: float = 0.7) -> List[Dict]:
-        """Combine semantic and keyword search results"""
+    async def hybrid_search(self,
+                            query: str,
+                            k: int = 5,
+                            semantic_weight: float = 0.7) -> List[Dict]:
+        """
+        Combine semantic and BM25 keyword search results with weighted reciprocal
+        rank fusion. Unlike the other searches, higher scores are better here
+        """
         if not self.vector_store:
             if not self.load_vector_store():
                 return []
 
-        # Get semantic search results
-        semantic_results = self.semantic_search(query, k=k, use_query_expansion=False)
-        
-        # Get keyword search results (using FAISS's exact match capability)
-        keyword_results = self.vector_store.similarity_search_with_score(
-            query, k=k, filter=lambda x: query.lower() in x.page_content.lower()
+        # Fetch deeper than k from each side so fusion has overlap to work with
+        depth = k * 2
+        semantic_results, keyword_results = await asyncio.gather(
+            self.semantic_search(query, k=depth, use_query_expansion=False),
+            asyncio.to_thread(self.vector_store.keyword_search_with_score, query, depth)
         )
         
         # Convert keyword results to same format
@@ -178,46 +222,8 @@ class SearchEngine:
             for doc, score in keyword_results
         ]
         
-        # Combine and normalize scores
-        all_results = {}
-        
-        for result in semantic_results:
-            key = result["content"]
-            all_results[key] = {
-                "content": result["content"],
-                "metadata": result["metadata"],
-                "semantic_score": result["score"],
-                "keyword_score": None
-            }
-            
-        for result in keyword_results:
-            key = result["content"]
-            if key in all_results:
-                all_results[key]["keyword_score"] = result["score"]
-            else:
-                all_results[key] = {
-                    "content": result["content"],
-                    "metadata": result["metadata"],
-                    "semantic_score": None,
-                    "keyword_score": result["score"]
-                }
-                
-        # Calculate final scores
-        final_results = []
-        for result in all_results.values():
-            semantic_score = result["semantic_score"] if result["semantic_score"] is not None else float('inf')
-            keyword_score = result["keyword_score"] if result["keyword_score"] is not None else float('inf')
-            
-            # Lower scores are better in FAISS
-            final_score = (semantic_weight * semantic_score + 
-                         (1 - semantic_weight) * keyword_score)
-            
-            final_results.append({
-                "content": result["content"],
-                "metadata": result["metadata"],
-                "score": final_score
-            })
-            
-        # Sort by final score and return top k
-        final_results.sort(key=lambda x: x["score"])
-        return final_results[:k]
\ No newline at end of file
+        fused = reciprocal_rank_fusion(
+            [semantic_results, keyword_results],
+            weights=[semantic_weight, 1 - semantic_weight]
+        )
+        return fused[:k]
@@ -1,29 +1,134 @@
-from typing import List, Dict
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
 import asyncio
-from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+from contextlib import aclosing
 from googlesearch import search as googlesearch
 import os
-from .content_ingestion import ContentIngestionPipeline
+from .content_ingestion import VECTOR_STORE_PATH, ContentIngestionPipeline
 from .search_engine import SearchEngine
 from .ai_enhancement import AIEnhancementService
+from .answer_pipeline import AnswerPipeline, document_sources
+from .cache import QueryCache
+from .http_fetcher import AsyncFetcher, get_fetcher
+from .ingestion_jobs import IngestionJobQueue, IngestionWorker
+from .llm_gateway import get_llm_gateway
+from .metrics import get_metrics
+from .startup import startup_timings
 import logging
 
 logger = logging.getLogger(__name__)
 
+PROVISIONAL_EXPLANATION = (
+    "No indexed documentation answers this yet. Relevant pages are being fetched "
+    "and indexed in the background; try again shortly or check the ingestion job's status."
+)
+
 class SearchOrchestrator:
-    def __init__(self):
-        self.content_ingestion = ContentIngestionPipeline()
-        self.search_engine = SearchEngine()
-        self.ai_enhancement = AIEnhancementService()
-        self.llm = ChatGroq(
-            api_key=os.getenv('GROQ_API_KEY'),
-            model_name=os.getenv('MODEL_NAME'),
-            max_tokens=2000,
-            temperature=0.3
+    def __init__(self,
+                 fetcher: Optional[AsyncFetcher] = None,
+                 url_search: Optional[Callable[[str, int], List[str]]] = None):
+        # One pooled fetcher loads every page that Google search turns up
+        self.fetcher = fetcher or get_fetcher()
+        # Blocking (query, num_results) -> URLs; Google search unless replaced, e.g. by benchmarks
+        self.url_search = url_search or (lambda query, num_results: list(googlesearch(query, num_results=num_results)))
+        with startup_timings.measure("content_ingestion"):
+            self.content_ingestion = ContentIngestionPipeline(self.fetcher)
+        # One gateway pools, rate-limits and coalesces every LLM call
+        with startup_timings.measure("llm_gateway"):
+            self.llm_gateway = get_llm_gateway()
+        with startup_timings.measure("search_engine"):
+            self.search_engine = SearchEngine(self.content_ingestion, self.llm_gateway)
+        with startup_timings.measure("ai_enhancement"):
+            self.ai_enhancement = AIEnhancementService(llm_gateway=self.llm_gateway)
+        with startup_timings.measure("answer_pipeline"):
+            self.llm = self.llm_gateway.chat_model(
+                model_name=os.getenv('MODEL_NAME'),
+                max_tokens=2000,
+                temperature=0.3
+            )
+            self.answer_pipeline = AnswerPipeline(self.llm, self.content_ingestion)
+        # Misses are ingested by background workers instead of inside the request
+        with startup_timings.measure("ingestion_worker"):
+            self.ingestion_queue = IngestionJobQueue(os.path.join(VECTOR_STORE_PATH, "ingestion_jobs.sqlite"))
+            # Every worker process can queue jobs, but only the index writer runs them
+            self.ingestion_worker = IngestionWorker(
+                self.ingestion_queue,
+                self._run_ingestion_job,
+                can_run=lambda: self.content_ingestion.is_writer
+            )
+            self.ingestion_worker.start()
+        self.ingestion_wait = float(os.getenv('INGESTION_WAIT_SECONDS', 10))
+        semantic_threshold = os.getenv('SEMANTIC_CACHE_THRESHOLD')
+        self._answer_cache = QueryCache(
+            "answer cache",
+            semantic_threshold=float(semantic_threshold) if semantic_threshold else None
+        )
+        self.metrics = get_metrics()
+        self.metrics.register_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        """Cache, LLM, index and ingestion figures for the metrics endpoint"""
+        for cache in (
+            self._answer_cache,
+            self.search_engine._query_cache,
+            self.search_engine._expansion_cache,
+            self.ai_enhancement._summary_cache
+        ):
+            labels, stats = {"cache": cache.name}, cache.stats()
+            yield "docsgpt_cache_hits_total", "counter", "Exact-key cache hits", labels, stats["hits"]
+            yield "docsgpt_cache_semantic_hits_total", "counter", "Cache hits by embedding similarity", labels, stats["semantic_hits"]
+            yield "docsgpt_cache_misses_total", "counter", "Exact-key cache misses", labels, stats["misses"]
+            yield "docsgpt_cache_evictions_total", "counter", "Cache entries evicted", labels, stats["evictions"]
+            yield "docsgpt_cache_entries", "gauge", "Entries held in each cache", labels, stats["entries"]
+            yield "docsgpt_cache_bytes", "gauge", "Estimated memory held by each cache", labels, stats["bytes"]
+            yield "docsgpt_cache_hit_ratio", "gauge", "Share of cache lookups served", labels, stats["hit_ratio"]
+
+        stats = self.llm_gateway.stats()
+        yield "docsgpt_llm_calls_total", "counter", "LLM calls sent to the provider", {}, stats["calls"]
+        yield "docsgpt_llm_coalesced_total", "counter", "LLM calls served by an identical call in flight", {}, stats["coalesced"]
+        yield "docsgpt_llm_retries_total", "counter", "LLM calls retried after an error", {}, stats["retries"]
+        for kind in ("input", "output"):
+            yield "docsgpt_llm_tokens_total", "counter", "LLM tokens used", {"type": kind}, stats[f"{kind}_tokens"]
+
+        store = self.content_ingestion.vector_store
+        yield "docsgpt_index_vectors", "gauge", "Vectors in the index", {}, store.ntotal if store else 0
+        yield "docsgpt_index_segments", "gauge", "Segments in the index", {}, len(store.segments) if store else 0
+        yield "docsgpt_index_version", "gauge", "Index changes seen by this process", {}, self.content_ingestion.index_version
+        yield "docsgpt_index_writer", "gauge", "1 if this process writes the index", {}, int(self.content_ingestion.is_writer)
+        for status, count in self.ingestion_queue.counts().items():
+            yield "docsgpt_ingestion_jobs", "gauge", "Ingestion jobs by status", {"status": status}, count
+
+    async def _get_cached_answer(self, query: str):
+        """
+        Look up a cached answer for the query, first by exact match and then, if
+        semantic caching is enabled, by embedding similarity. Returns the cached
+        results (or None), the query embedding for storing a fresh answer and the
+        index version the answer will be retrieved from.
+        """
+        version = self.content_ingestion.index_version
+        cached = self._answer_cache.get(query, version=version)
+        if cached is not None or self._answer_cache.semantic_threshold is None:
+            return cached, None, version
+        
+        try:
+            query_embedding = await self.content_ingestion.embeddings.aembed_query(query)
+        except Exception as e:
+            logger.warning(f"Could not embed query for semantic cache lookup: {str(e)}")
+            return None, None, version
+        cached = self._answer_cache.get_similar(query_embedding, version=version)
+        if cached is not None:
+            logger.info("Serving semantically similar cached answer")
+        return cached, query_embedding, version
+
+    def _cache_answer(self, query: str, results: List[Dict], version: int, query_embedding=None):
+        """
+        Cache answers against the index version read before their retrieval, so an
+        answer overtaken by an index change is dropped rather than cached as current
+        """
+        self._answer_cache.set(
+            query,
+            results,
+            version=version,
+            embedding=query_embedding
         )
 
     async def sync_documentation(self):
@@ -39,132 +144,312 @@ class SearchOrchestrator:
         """Get relevant URLs for the query using Google search"""
         try:
             enhanced_query = f"{query} (documentation OR tutorial OR example OR guide)"
-            urls = await asyncio.to_thread(
-                lambda: list(googlesearch(enhanced_query, num_results=num_results))
-            )
+            with self.metrics.span("google_search"):
+                urls = await asyncio.to_thread(self.url_search, enhanced_query, num_results)
             logger.info(f"Found {len(urls)} URLs for query: {query}")
             return urls
         except Exception as e:
             logger.error(f"Error in Google search: {str(e)}")
             return []
 
+    async def _run_ingestion_job(self, job: Dict) -> Dict:
+        """Discover URLs for the job's query unless it lists them, then ingest them"""
+        urls = job["urls"] or await self.get_relevant_urls(job["query"])
+        if not urls:
+            logger.warning(f"No URLs found for ingestion job {job['id']}")
+            return {"urls": 0, "chunks": 0}
+        documents = await self.content_ingestion.process_domains(urls)
+        return {"urls": len(urls), "chunks": len(documents)}
+
+    async def enqueue_ingestion(self, query: Optional[str] = None, urls: Optional[List[str]] = None) -> Dict:
+        """Queue an ingestion job (an identical pending query job is reused) and wake the workers"""
+        job = await asyncio.to_thread(self.ingestion_queue.enqueue, query, urls)
+        self.ingestion_worker.notify()
+        return job
+
+    async def _ingest_miss(self, query: str) -> Dict:
+        """Queue ingestion for a query the index cannot answer and wait for it up to the deadline"""
+        job = await self.enqueue_ingestion(query)
+        logger.info(f"Queued ingestion job {job['id']} for query: {query}")
+        with self.metrics.span("ingestion_wait"):
+            finished = await self.ingestion_worker.wait(job["id"], self.ingestion_wait)
+        if finished is None:
+            # wait() found no such job in the queue; report it as still pending rather than finished
+            return job
+        job = finished
+        if job["status"] == "done" and not self.content_ingestion.is_writer:
+            # The writer process indexed the pages; map its new segments before answering
+            await asyncio.to_thread(self.content_ingestion.refresh)
+        return job
+
+    @staticmethod
+    def _provisional_result(job: Dict) -> Dict:
+        return {
+            "title": "Indexing in progress",
+            "explanation": PROVISIONAL_EXPLANATION,
+            "sources": [],
+            "job_id": job["id"],
+            "provisional": True
+        }
+
     async def search(self, query: str, k: int = 3) -> List[Dict]:
         """
         Search flow:
+        0. Serve a cached answer for the same (or a near-identical) query
         1. Check vector database for existing results
-        2. If no results, perform Google search for relevant URLs
-        3. Process found URLs and update vector store
+        2. If no results, queue a background job that finds relevant URLs with
+           Google search and ingests them
+        3. Wait for the job up to INGESTION_WAIT_SECONDS; if it has not finished,
+           return a provisional result carrying its job_id
         4. Generate AI-enhanced response
         """
+        with self.metrics.span("search"):
+            with self.metrics.span("cache_lookup"):
+                cached, query_embedding, version = await self._get_cached_answer(query)
+            if cached is not None:
+                self._count_search("cached")
+                return cached
+
+            results, version = await self._search(query, k, version)
+        self._record_outcome(query, results, version, query_embedding)
+        return results
+
+    def _record_outcome(self, query: str, results: List[Dict], version: int, query_embedding=None):
+        """Cache complete answers and count the search by outcome"""
+        if results and results[0].get("explanation") and not results[0].get("provisional"):
+            self._cache_answer(query, results, version, query_embedding)
+            self._count_search("answered")
+        elif results:
+            self._count_search("provisional")
+        else:
+            self._count_search("empty")
+
+    def _count_search(self, outcome: str):
+        self.metrics.inc("docsgpt_searches_total", help="Searches by outcome", outcome=outcome)
+
+    @staticmethod
+    def _answer_results(chain_response: Dict) -> List[Dict]:
+        return [{
+            "title": "Answer",
+            "explanation": chain_response.get('result', ''),
+            "sources": document_sources(chain_response.get('source_documents', []))
+        }]
+
+    @staticmethod
+    def _is_sufficient(chain_response: Optional[Dict]) -> bool:
+        """Whether an answer from the existing index is good enough to skip ingestion"""
+        answer = chain_response.get('result', '') if chain_response else ''
+        return bool(answer and len(answer.strip()) > 50)
+
+    async def _search(self, query: str, k: int, version: int) -> Tuple[List[Dict], int]:
+        """
+        Uncached search flow, steps 1-4 of search(). Returns the results and the
+        index version they were retrieved from, ``version`` unless ingestion ran
+        """
         try:
             # First try to get results from existing vector store
-            retriever = self.content_ingestion.get_retriever()
-            if retriever:
+            if self.answer_pipeline.chain is not None:
                 logger.info("Checking vector database for existing results...")
                 try:
-                    qa_chain = RetrievalQA.from_chain_type(
-                        llm=self.llm,
-                        chain_type="stuff",
-                        retriever=retriever,
-                        return_source_documents=True,
-                        verbose=True,
-                        chain_type_kwargs={
-                            "prompt": PromptTemplate(
-                                template="""You are a professional technical documentation assistant. Use the following pieces of context to provide a comprehensive and precise answer to the question.
-                                If the context lacks sufficient information, clearly state what is known and what additional details might be necessary.
-                                Always include pertinent code examples when applicable.
-                                
-                                Context: {context}
-                                Question: {question}
-                                
-                                Detailed Answer:""",
-                                input_variables=["context", "question"]
-                            )
-                        }
-                    )
+                    chain_response = await self.answer_pipeline.answer(query)
                     
-                    chain_response = await asyncio.to_thread(
-                        qa_chain,
-                        {"query": query}
-                    )
-                    
-                    if chain_response and chain_response.get('result'):
-                        answer = chain_response.get('result', '')
-                        sources = chain_response.get('source_documents', [])
-                        if answer and len(answer.strip()) > 50:
-                            logger.info("Found results in vector database")
-                            return [{
-                                "title": "Answer",
-                                "explanation": answer,
-                                "sources": [
-                                    doc.metadata.get('source', '') 
-                                    for doc in sources 
-                                    if doc.metadata.get('source')
-                                ]
-                            }]
+                    if self._is_sufficient(chain_response):
+                        logger.info("Found results in vector database")
+                        return self._answer_results(chain_response), version
                 
                 except Exception as e:
                     logger.warning(f"Vector DB search failed: {str(e)}")
             
             # If we're here, either no vector DB results or they weren't sufficient
-            logger.info("Performing Google search for relevant content...")
-            urls = await self.get_relevant_urls(query)
-            if not urls:
-                logger.warning("No URLs found from Google search")
-                return []
+            return await self._answer_after_ingestion(query, version)
             
-            # Process the found URLs
-            results = await self.content_ingestion.process_domains(urls)
+        except Exception as e:
+            logger.error(f"Error in search: {str(e)}")
+            return [], version
+
+    async def _answer_after_ingestion(self, query: str, version: int) -> Tuple[List[Dict], int]:
+        """
+        Ingest pages for a query the index could not answer, then answer it (steps
+        2-4 of search()). Returns the results and the index version read after ingestion
+        """
+        try:
+            job = await self._ingest_miss(query)
+            if job["status"] == "failed":
+                return [], version
+            if job["status"] != "done":
+                return [self._provisional_result(job)], version
             
-            # Get updated retriever with new content
-            retriever = self.content_ingestion.get_retriever()
-            if not retriever:
+            # The pipeline picks up the updated retriever with the new content
+            version = self.content_ingestion.index_version
+            if self.answer_pipeline.chain is None:
                 logger.warning("No retriever available after processing URLs")
-                return []
-            
-            # Create QA chain with new content
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=retriever,
-                return_source_documents=True,
-                verbose=True,
-                chain_type_kwargs={
-                    "prompt": PromptTemplate(
-                        template="""You are a helpful technical documentation assistant. Use the following pieces of context to provide a detailed and accurate answer to the question.
-                        If the context doesn't contain enough information, explain what is known and what additional information might be needed.
-                        Always include relevant code examples when available.
-                        
-                        Context: {context}
-                        Question: {question}
-                        
-                        Detailed Answer:""",
-                        input_variables=["context", "question"]
-                    )
-                }
-            )
+                return [], version
             
-            chain_response = await asyncio.to_thread(
-                qa_chain,
-                {"query": query}
-            )
+            chain_response = await self.answer_pipeline.answer(query)
             
             if not chain_response:
-                return []
+                return [], version
             
-            answer = chain_response.get('result', '')
-            sources = chain_response.get('source_documents', [])
-            
-            return [{
-                "title": "Answer",
-                "explanation": answer,
-                "sources": [
-                    doc.metadata.get('source', '') 
-                    for doc in sources 
-                    if doc.metadata.get('source')
-                ]
-            }]
+            return self._answer_results(chain_response), version
             
         except Exception as e:
             logger.error(f"Error in search: {str(e)}")
-            return []
+            return [], version
+
+    async def search_batch(self, queries: List[str], max_concurrency: Optional[int] = None) -> AsyncIterator[Dict]:
+        """
+        Answer many queries, yielding {"index": i, "query": ..., "results": [...]}
+        for each in the order they finish; results are what search() returns.
+
+        Cached answers are yielded first. The remaining queries are embedded in
+        one batch, which serves both the semantic cache and retrieval, and are
+        answered by AnswerPipeline.answer_batch with at most ``max_concurrency``
+        (BATCH_MAX_CONCURRENCY) generations at a time. Queries the index cannot
+        answer go through ingestion as in search() while the rest are generated.
+        """
+        if not queries:
+            return
+        events: asyncio.Queue = asyncio.Queue()
+        emitted = set()
+
+        def emit(index: int, results: List[Dict]):
+            emitted.add(index)
+            events.put_nowait({"index": index, "query": queries[index], "results": results})
+
+        async def run():
+            try:
+                with self.metrics.span("search_batch"):
+                    await self._search_batch(queries, max_concurrency, emit)
+            except Exception as e:
+                logger.error(f"Error in batch search: {str(e)}")
+            for index in range(len(queries)):
+                if index not in emitted:
+                    self._count_search("empty")
+                    emit(index, [])
+
+        task = asyncio.create_task(run())
+        try:
+            for _ in range(len(queries)):
+                yield await events.get()
+        finally:
+            task.cancel()
+
+    async def _search_batch(self,
+                            queries: List[str],
+                            max_concurrency: Optional[int],
+                            emit: Callable[[int, List[Dict]], None]):
+        """Answer every query of search_batch(), passing each index and its results to ``emit``"""
+        version = self.content_ingestion.index_version
+        pending = []
+        with self.metrics.span("batch_cache_lookup"):
+            for index, query in enumerate(queries):
+                cached = self._answer_cache.get(query, version=version)
+                if cached is None:
+                    pending.append(index)
+                else:
+                    self._count_search("cached")
+                    emit(index, cached)
+        if not pending:
+            return
+
+        with self.metrics.span("batch_embed"):
+            embeddings = await self.content_ingestion.embeddings.aembed_documents([queries[i] for i in pending])
+        if self._answer_cache.semantic_threshold is not None:
+            uncached = []
+            for index, embedding in zip(pending, embeddings):
+                cached = self._answer_cache.get_similar(embedding, version=version)
+                if cached is None:
+                    uncached.append((index, embedding))
+                else:
+                    self._count_search("cached")
+                    emit(index, cached)
+            pending, embeddings = [index for index, _ in uncached], [embedding for _, embedding in uncached]
+        embedding_of = dict(zip(pending, embeddings))
+
+        semaphore = asyncio.Semaphore(max_concurrency or self.answer_pipeline.batch_concurrency)
+        misses = []
+
+        async def answer_miss(index: int):
+            # Ingestion jobs for identical queries are shared by the queue
+            async with semaphore:
+                results, answered_version = await self._answer_after_ingestion(queries[index], version)
+            self._record_outcome(queries[index], results, answered_version, embedding_of[index])
+            emit(index, results)
+
+        try:
+            async with aclosing(self.answer_pipeline.answer_batch(
+                [queries[i] for i in pending], embeddings, max_concurrency
+            )) as responses:
+                async for position, chain_response in responses:
+                    index = pending[position]
+                    if self._is_sufficient(chain_response):
+                        results = self._answer_results(chain_response)
+                        self._record_outcome(queries[index], results, version, embedding_of[index])
+                        emit(index, results)
+                    else:
+                        misses.append(asyncio.create_task(answer_miss(index)))
+            if misses:
+                logger.info(f"Batch search ingesting {len(misses)} queries the index could not answer")
+                await asyncio.gather(*misses)
+        finally:
+            for task in misses:
+                task.cancel()
+
+    async def search_stream(self, query: str) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of search. Yields events as they become available:
+        - {"type": "sources", "sources": [...]} once retrieval finishes
+        - {"type": "token", "content": "..."} for each piece of the answer
+        - {"type": "job", "job_id": "...", "status": "..."} when the index had no answer
+          and ingestion is still running; a provisional answer token follows
+        - {"type": "error", "detail": "..."} if the search fails
+        - {"type": "done"} at the end
+        """
+        try:
+            with self.metrics.span("cache_lookup"):
+                cached, query_embedding, version = await self._get_cached_answer(query)
+            if cached is not None:
+                self._count_search("cached")
+                yield {"type": "sources", "sources": cached[0]["sources"]}
+                yield {"type": "token", "content": cached[0]["explanation"]}
+                yield {"type": "done"}
+                return
+            
+            sources, tokens = None, []
+            async for event in self.answer_pipeline.astream(query):
+                if event["type"] == "sources":
+                    sources = event["sources"]
+                else:
+                    tokens.append(event["content"])
+                yield event
+            
+            provisional = False
+            if sources is None:
+                # Nothing retrieved; ingest in the background, answering if it finishes in time
+                job = await self._ingest_miss(query)
+                if job["status"] == "done":
+                    version = self.content_ingestion.index_version
+                    async for event in self.answer_pipeline.astream(query):
+                        if event["type"] == "sources":
+                            sources = event["sources"]
+                        else:
+                            tokens.append(event["content"])
+                        yield event
+                elif job["status"] != "failed":
+                    provisional = True
+                    yield {"type": "job", "job_id": job["id"], "status": job["status"]}
+                    yield {"type": "token", "content": PROVISIONAL_EXPLANATION}
+            
+            if tokens and not provisional:
+                self._cache_answer(query, [{
+                    "title": "Answer",
+                    "explanation": "".join(tokens),
+                    "sources": sources or []
+                }], version, query_embedding)
+            self._count_search("provisional" if provisional else "answered" if tokens else "empty")
+            
+        except Exception as e:
+            logger.error(f"Error in streaming search: {str(e)}")
+            yield {"type": "error", "detail": str(e)}
+        
+        yield {"type": "done"}
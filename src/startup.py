@@ -0,0 +1,103 @@
+from typing import Dict
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Imported one at a time during start-up so the report shows where import time goes.
+# Each entry's time includes whatever it pulls in that earlier ones did not.
+HEAVY_MODULES = (
+    "numpy",
+    "faiss",
+    "langchain_core",
+    "langchain",
+    "langchain_groq",
+    "httpx",
+    "googlesearch",
+    "src.vector_store",
+    "src.content_ingestion",
+    "src.search_engine",
+    "src.ai_enhancement",
+    "src.answer_pipeline",
+    "src.search_orchestrator",
+)
+
+
+class StartupTimings:
+    """Seconds spent importing, initialising and warming up each component"""
+
+    def __init__(self):
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, component: str, phase: str = "init"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = round(time.perf_counter() - start, 4)
+            with self._lock:
+                self._timings.setdefault(component, {})[phase] = elapsed
+            logger.info(f"{component} {phase} took {elapsed:.2f}s")
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {component: dict(phases) for component, phases in self._timings.items()}
+
+
+startup_timings = StartupTimings()
+
+_search_orchestrator = None
+_search_orchestrator_lock = threading.Lock()
+_state = {"status": "cold", "error": None}
+
+
+def get_search_orchestrator():
+    """Return the process's SearchOrchestrator, importing and building it on first use"""
+    global _search_orchestrator
+    if _search_orchestrator is None:
+        with _search_orchestrator_lock:
+            if _search_orchestrator is None:
+                for module in HEAVY_MODULES:
+                    with startup_timings.measure(module, "import"):
+                        importlib.import_module(module)
+                from .search_orchestrator import SearchOrchestrator
+                with startup_timings.measure("search_orchestrator"):
+                    _search_orchestrator = SearchOrchestrator()
+    return _search_orchestrator
+
+
+def set_search_orchestrator(orchestrator):
+    """Serve requests with ``orchestrator``, e.g. one wired to offline providers"""
+    global _search_orchestrator
+    with _search_orchestrator_lock:
+        _search_orchestrator = orchestrator
+
+
+def warm_up():
+    """
+    Build the orchestrator and load the embedding model ahead of the first
+    request. Failures are recorded for the readiness report, not raised
+    """
+    _state.update(status="warming", error=None)
+    try:
+        orchestrator = get_search_orchestrator()
+        with startup_timings.measure("embedding_model", "warm_up"):
+            orchestrator.content_ingestion.embeddings.warm_up()
+        _state["status"] = "ready"
+        logger.info("Warm-up finished")
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+        _state.update(status="failed", error=str(e))
+
+
+def readiness() -> Dict:
+    """Warm-up status (cold, warming, ready or failed) with the timings recorded so far"""
+    report = {"status": _state["status"], "components": startup_timings.report()}
+    if _state["error"]:
+        report["error"] = _state["error"]
+    return report
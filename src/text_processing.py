@@ -0,0 +1,99 @@
+from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+from bs4 import BeautifulSoup
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+MIN_CHUNK_LENGTH = 50
+_MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+_splitter = None
+
+
+def _get_splitter() -> RecursiveCharacterTextSplitter:
+    """Splitter built once per worker process"""
+    global _splitter
+    if _splitter is None:
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200,
+            length_function=len,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+    return _splitter
+
+
+def extract_text(html: str, url: str) -> Dict:
+    """Page text plus WebBaseLoader's title/description/language metadata and the source domain"""
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url, "domain": urlsplit(url).netloc}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    return {"text": soup.get_text(), "metadata": metadata}
+
+
+def extract_markdown(text: str, url: str) -> Dict:
+    """Markdown source as-is, titled by its first heading, with the source domain"""
+    metadata = {"source": url, "domain": urlsplit(url).netloc}
+    if heading := _MARKDOWN_HEADING.search(text):
+        metadata["title"] = heading.group(1)
+    return {"text": text, "metadata": metadata}
+
+
+def parse_and_chunk(html: str, url: str, markdown: bool = False) -> List[Dict]:
+    """Turn a fetched page (or a Markdown file) into chunk records ({"content", "metadata"})"""
+    page = extract_markdown(html, url) if markdown else extract_text(html, url)
+    timestamp = datetime.utcnow().isoformat()
+
+    documents = []
+    for i, chunk in enumerate(_get_splitter().split_text(page["text"])):
+        chunk = chunk.strip()
+        if len(chunk) < MIN_CHUNK_LENGTH:  # Skip small chunks
+            continue
+        documents.append({
+            "content": chunk,
+            "metadata": {
+                **page["metadata"],
+                "source": url,
+                "chunk_id": i,
+                "timestamp": timestamp
+            }
+        })
+    return documents
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all ingestion, sized by PARSE_WORKERS (default: all cores)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Spawn rather than fork: the parent runs model and I/O threads
+                _pool = ProcessPoolExecutor(
+                    max_workers=int(os.getenv('PARSE_WORKERS', 0)) or os.cpu_count(),
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+async def aparse_and_chunk(html: str,
+                           url: str,
+                           pool: Optional[ProcessPoolExecutor] = None,
+                           markdown: bool = False) -> List[Dict]:
+    """Run parse_and_chunk in the process pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool or get_process_pool(), parse_and_chunk, html, url, markdown)
@@ -0,0 +1,83 @@
+from typing import Dict, Optional
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class URLRegistry:
+    """Remembers when each URL was ingested and its HTTP validators.
+
+    URLs ingested less than ``URL_REFRESH_SECONDS`` ago are skipped outright;
+    older ones are re-fetched conditionally with ``If-None-Match`` and
+    ``If-Modified-Since`` so unchanged pages cost a 304 instead of a full
+    fetch, split and embedding pass.
+    """
+
+    def __init__(self, path: str, refresh_seconds: Optional[float] = None):
+        self.path = path
+        self.refresh_seconds = refresh_seconds or float(os.getenv('URL_REFRESH_SECONDS', 86400))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_hash, fetched_at FROM urls WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "url": url,
+            "etag": row[0],
+            "last_modified": row[1],
+            "content_hash": row[2],
+            "fetched_at": row[3]
+        }
+
+    def is_fresh(self, record: Optional[Dict]) -> bool:
+        """Whether the URL was ingested recently enough to skip entirely"""
+        return record is not None and time.time() - record["fetched_at"] < self.refresh_seconds
+
+    @staticmethod
+    def conditional_headers(record: Optional[Dict]) -> Dict[str, str]:
+        """Request headers that let the server answer 304 Not Modified"""
+        headers = {}
+        if record and record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record and record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def touch(self, url: str):
+        """Mark a URL as checked without changing its validators"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE urls SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def record(self,
+               url: str,
+               etag: Optional[str] = None,
+               last_modified: Optional[str] = None,
+               content_hash: Optional[str] = None):
+        """Record a successful ingestion of the URL"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, etag, last_modified, content_hash, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, time.time())
+            )
@@ -0,0 +1,725 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import asyncio
+import contextlib
+import json
+import math
+import os
+import pickle
+import threading
+import uuid
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from .ann_index import IndexConfig, search_parameters
+from .docstore import SQLiteDocstore
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+DOCSTORE_FILE = "docstore.sqlite"
+SEGMENTS_DIR = "segments"
+# Filtered searches copy out and brute-force at most this many matching vectors per segment
+SUBSET_COPY_MAX = 4096
+# Indexed filters whose every field matches this many rows are applied to an over-fetched
+# unfiltered search rather than resolved to all of their row ids
+BROAD_FILTER_ROWS = 10000
+
+
+def _atomic_write(path: str, write: Callable[[str], None]):
+    """Write a file through a temporary sibling and rename it into place"""
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _first_rowid(segment: "Segment") -> int:
+    return int(segment.rowids[0]) if len(segment) else -1
+
+
+def _matches_filter(metadata: Dict, filter: Union[Dict, Callable[[Dict], bool]]) -> bool:
+    if callable(filter):
+        return filter(metadata)
+    return all(metadata.get(key) == value for key, value in filter.items())
+
+
+class Segment:
+    """Immutable batch of vectors and the docstore row ids they belong to.
+
+    Persisted segments hold read-only memory maps of their ``.npy`` files, so
+    vectors are paged in on demand and shared through the OS page cache by every
+    process that opens the same store. Row ids are assigned in increasing order
+    and segments are only ever concatenated, so ``rowids`` is always sorted.
+
+    Large segments may also carry an approximate index (``ann``) over the same
+    vectors in the same order; searches use it unless ``exact`` is requested.
+    """
+
+    __slots__ = ("name", "vectors", "rowids", "ann")
+
+    def __init__(self, name: str, vectors: np.ndarray, rowids: np.ndarray, ann: Optional[faiss.Index] = None):
+        self.name = name
+        self.vectors = vectors
+        self.rowids = rowids
+        self.ann = ann
+
+    def __len__(self) -> int:
+        return len(self.rowids)
+
+    def search(self, queries: np.ndarray, k: int, exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """L2 search of a (n_queries, d) batch returning squared distances and row ids"""
+        k = min(k, len(self))
+        if self.ann is not None and not exact:
+            distances, indices = self.ann.search(queries, k)
+        else:
+            distances, indices = faiss.knn(queries, self.vectors, k)
+        return distances, np.where(indices >= 0, self.rowids[indices], -1)
+
+    def positions(self, rowids: np.ndarray) -> np.ndarray:
+        """Positions in this segment of those of the (sorted) row ids it contains"""
+        positions = np.searchsorted(self.rowids, rowids)
+        in_range = positions < len(self)
+        positions, rowids = positions[in_range], rowids[in_range]
+        return positions[self.rowids[positions] == rowids]
+
+    def search_subset(self, query: np.ndarray, positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        L2 search restricted to the vectors at ``positions``. Small subsets are
+        copied out and searched exactly; larger ones go through the approximate
+        index with a selector, or through a deeper exact search of the whole
+        segment, so the cost stays that of an unfiltered search
+        """
+        k = min(k, len(positions))
+        if len(positions) > SUBSET_COPY_MAX:
+            mask = np.zeros(len(self), dtype=bool)
+            mask[positions] = True
+            if self.ann is not None:
+                selector = faiss.IDSelectorBitmap(np.packbits(mask, bitorder="little"))
+                distances, indices = self.ann.search(query, k, params=search_parameters(self.ann, selector))
+                # A graph search can run out of matching neighbours; the exact subset search cannot
+                if (indices >= 0).sum() >= k:
+                    return distances, np.where(indices >= 0, self.rowids[indices], -1)
+            elif len(positions) * 4 > len(self):
+                return self._search_masked(query, mask, k)
+        distances, indices = faiss.knn(query, np.ascontiguousarray(self.vectors[positions]), k)
+        return distances, np.where(indices >= 0, self.rowids[positions][indices], -1)
+
+    def _search_masked(self, query: np.ndarray, mask: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact search of one query over the whole segment, keeping the first ``k`` hits inside ``mask``"""
+        # Deep enough to expect twice k matches among the hits, deepened if that falls short
+        depth = min(len(self), 2 * k * len(self) // int(mask.sum()) + k)
+        while True:
+            distances, indices = faiss.knn(query, self.vectors, depth)
+            keep = mask[indices[0]]
+            if keep.sum() >= k or depth == len(self):
+                break
+            depth = min(len(self), depth * 2)
+        distances, indices = distances[:, keep][:, :k], indices[:, keep][:, :k]
+        return distances, self.rowids[indices]
+
+
+class IndexSnapshot:
+    """Immutable list of the segments making up one version of the index.
+
+    Writers never change a snapshot; they publish a new one. Readers pin the
+    current snapshot for the length of a search, and a superseded snapshot is
+    released when its last reader unpins it.
+    """
+
+    __slots__ = ("version", "segments", "readers")
+
+    def __init__(self, version: int, segments: Sequence[Segment]):
+        self.version = version
+        self.segments = tuple(segments)
+        self.readers = 0
+
+    @property
+    def ntotal(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+
+class SegmentedVectorStore(VectorStore):
+    """FAISS-backed vector store persisted as append-only segments plus a manifest.
+
+    Each ``add_texts`` call becomes a new segment: its vectors and documents are
+    written to new files and only then is ``manifest.json`` atomically replaced to
+    include it, so a reader of the directory never sees a half-written index and
+    ingest cost is proportional to the batch, not the corpus. Searches query every
+    segment and merge the results; ``compact`` periodically merges segments of
+    similar size in the background, so each vector is rewritten (and indexed) a
+    logarithmic number of times and large segments are left alone.
+
+    Loading only memory-maps the segment vectors; document text and metadata stay
+    in a SQLite docstore and are read for the top hits of each search.
+
+    ``index_config`` chooses the approximate index (HNSW, IVF-Flat or IVF-PQ) that
+    compaction builds for large segments; small append segments stay exact, and
+    filtered searches use the approximate index only when many vectors match.
+    The build parameters are recorded in the manifest.
+
+    Searches run against an ``IndexSnapshot`` and never wait for writers: appends
+    and compactions build their segments first and then publish a new snapshot
+    in one assignment. Files of compacted-away segments are deleted only once no
+    pinned snapshot still uses them.
+    """
+
+    def __init__(self,
+                 embedding: Embeddings,
+                 path: Optional[str] = None,
+                 index_config: Optional[IndexConfig] = None):
+        self.embedding = embedding
+        self.path = path
+        self.index_config = index_config or IndexConfig()
+        self._snapshot = IndexSnapshot(0, [])
+        # Superseded snapshots that readers still hold
+        self._pinned: List[IndexSnapshot] = []
+        # Only guards reader counts and the snapshot swap, never a search
+        self._snapshot_lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+        self.docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILE) if path else None)
+        self._obsolete: List[str] = []
+        # Obsolete segments other processes are done with, deleted once released here too
+        self._deletable = set()
+        self._next_segment = 1
+        self._write_lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread = None
+        self._stop_compaction = threading.Event()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @property
+    def segments(self) -> List[Segment]:
+        return list(self._snapshot.segments)
+
+    @property
+    def version(self) -> int:
+        """Incremented every time a new snapshot is published"""
+        return self._snapshot.version
+
+    @property
+    def ntotal(self) -> int:
+        return self._snapshot.ntotal
+
+    # Snapshots
+
+    @contextlib.contextmanager
+    def snapshot(self) -> Iterator[IndexSnapshot]:
+        """Pin the current snapshot so its segment files outlive any compaction during the read"""
+        with self._snapshot_lock:
+            snapshot = self._snapshot
+            snapshot.readers += 1
+        try:
+            yield snapshot
+        finally:
+            with self._snapshot_lock:
+                snapshot.readers -= 1
+                released = not snapshot.readers and snapshot in self._pinned
+                if released:
+                    self._pinned.remove(snapshot)
+            if released:
+                self._delete_released_segments()
+
+    def _publish(self, segments: List[Segment]):
+        """Make ``segments`` the current snapshot; writers call this holding the write lock"""
+        with self._snapshot_lock:
+            previous = self._snapshot
+            self._snapshot = IndexSnapshot(previous.version + 1, segments)
+            if previous.readers:
+                self._pinned.append(previous)
+        self._delete_released_segments()
+
+    def _delete_released_segments(self):
+        """Delete the files of deletable segments that no snapshot still references"""
+        with self._snapshot_lock:
+            in_use = {
+                segment.name
+                for snapshot in [self._snapshot, *self._pinned]
+                for segment in snapshot.segments
+            }
+            released = self._deletable - in_use
+            self._deletable -= released
+        for name in released:
+            for suffix in (".npy", ".ids.npy", ".ann.faiss"):
+                if os.path.exists(self._segment_path(name, suffix)):
+                    os.remove(self._segment_path(name, suffix))
+
+    # Persistence
+
+    def _segment_path(self, name: str, suffix: str) -> str:
+        return os.path.join(self.path, SEGMENTS_DIR, f"{name}{suffix}")
+
+    def _write_segment(self, segment: Segment) -> Segment:
+        """Persist a segment and return it backed by memory maps of the written files"""
+        os.makedirs(os.path.join(self.path, SEGMENTS_DIR), exist_ok=True)
+
+        def writer(array):
+            def write(tmp_path):
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+            return write
+
+        vectors_path = self._segment_path(segment.name, ".npy")
+        rowids_path = self._segment_path(segment.name, ".ids.npy")
+        _atomic_write(vectors_path, writer(segment.vectors))
+        _atomic_write(rowids_path, writer(segment.rowids))
+        if segment.ann is not None:
+            _atomic_write(
+                self._segment_path(segment.name, ".ann.faiss"),
+                lambda tmp_path: faiss.write_index(segment.ann, tmp_path)
+            )
+        return Segment(
+            segment.name,
+            np.load(vectors_path, mmap_mode="r"),
+            np.load(rowids_path, mmap_mode="r"),
+            segment.ann
+        )
+
+    def _load_segment(self, name: str) -> Segment:
+        ann = None
+        ann_path = self._segment_path(name, ".ann.faiss")
+        if os.path.exists(ann_path):
+            # Approximate indexes are read into memory; only the raw vectors are mapped
+            ann = faiss.read_index(ann_path)
+            self.index_config.tune(ann)
+        return Segment(
+            name,
+            np.load(self._segment_path(name, ".npy"), mmap_mode="r"),
+            np.load(self._segment_path(name, ".ids.npy"), mmap_mode="r"),
+            ann
+        )
+
+    def _write_manifest(self, segments: List[Segment]):
+        manifest = {
+            "next_segment": self._next_segment,
+            "segments": [segment.name for segment in segments],
+            # Deletable segments stay listed until removed, so a restart still cleans them up
+            "obsolete": self._obsolete + sorted(self._deletable),
+            "index": self.index_config.to_dict()
+        }
+
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+
+        _atomic_write(os.path.join(self.path, MANIFEST_FILE), write)
+
+    @classmethod
+    def load(cls,
+             path: str,
+             embedding: Embeddings,
+             index_config: Optional[IndexConfig] = None,
+             read_only: bool = False) -> "SegmentedVectorStore":
+        """
+        Load a store from ``path``, migrating a legacy ``FAISS.save_local`` index
+        unless ``read_only``. Without ``index_config`` the index type the store was
+        built with is kept
+        """
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            store = cls(embedding, path, index_config)
+            if not read_only:
+                store._migrate_legacy()
+            return store
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if index_config is None and "index" in manifest:
+            index_config = IndexConfig.from_dict(manifest["index"])
+        store = cls(embedding, path, index_config)
+        store._next_segment = manifest["next_segment"]
+        store._obsolete = manifest.get("obsolete", [])
+        store._publish([store._load_segment(name) for name in manifest["segments"]])
+        logger.info(f"Mapped {len(store.segments)} segments with {store.ntotal} vectors from {path}")
+        return store
+
+    def refresh(self) -> bool:
+        """
+        Publish the segments another process has added to the manifest since this
+        one was read. Returns whether anything changed
+        """
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        loaded = {segment.name: segment for segment in self._snapshot.segments}
+        if manifest["segments"] == list(loaded):
+            return False
+        with self._write_lock:
+            # Segments listed in a manifest stay on disk for a full compaction cycle
+            segments = [loaded.get(name) or self._load_segment(name) for name in manifest["segments"]]
+            self._next_segment = manifest["next_segment"]
+            self._obsolete = manifest.get("obsolete", [])
+            self._publish(segments)
+        return True
+
+    def _migrate_legacy(self):
+        """Convert ``index.faiss``/``index.pkl`` written by FAISS.save_local into a segment"""
+        index_path = os.path.join(self.path, "index.faiss")
+        docstore_path = os.path.join(self.path, "index.pkl")
+        if not (os.path.exists(index_path) and os.path.exists(docstore_path)):
+            return
+        index = faiss.read_index(index_path)
+        with open(docstore_path, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        ids = [index_to_docstore_id[i] for i in range(index.ntotal)]
+        texts = [docstore.search(doc_id).page_content for doc_id in ids]
+        metadatas = [docstore.search(doc_id).metadata for doc_id in ids]
+        self.add_embeddings(texts, index.reconstruct_n(0, index.ntotal), metadatas, ids)
+        logger.info(f"Migrated legacy index at {self.path} ({len(ids)} vectors) to segments; "
+                    f"index.faiss and index.pkl are no longer read")
+
+    # Writes
+
+    def add_embeddings(self,
+                       texts: List[str],
+                       embeddings: Union[np.ndarray, List[List[float]]],
+                       metadatas: Optional[List[Dict]] = None,
+                       ids: Optional[List[str]] = None,
+                       replace_sources: Iterable[str] = ()) -> List[str]:
+        """
+        Append precomputed embeddings as a new segment and persist it. Documents
+        of ``replace_sources`` are deleted as the new ones are stored; their vectors
+        are skipped by searches and dropped by compaction
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if not len(texts):
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+
+        with self._write_lock:
+            rowids = self.docstore.add(ids, texts, metadatas, replace_sources)
+            segment = Segment(f"seg-{self._next_segment:06d}", vectors, rowids)
+            self._next_segment += 1
+            if self.path:
+                segment = self._write_segment(segment)
+            segments = [*self._snapshot.segments, segment]
+            if self.path:
+                self._write_manifest(segments)
+            self._publish(segments)
+        return ids
+
+    def add_texts(self,
+                  texts: Iterable[str],
+                  metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    async def aadd_texts(self,
+                         texts: Iterable[str],
+                         metadatas: Optional[List[Dict]] = None,
+                         ids: Optional[List[str]] = None,
+                         **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        embeddings = await self.embedding.aembed_documents(texts)
+        return await asyncio.to_thread(self.add_embeddings, texts, embeddings, metadatas, ids)
+
+    @staticmethod
+    def _size_tier(segments: Sequence[Segment], fanout: int) -> List[Segment]:
+        """
+        Segments of the smallest size tier holding at least ``fanout`` of them, or
+        none. Tiers grow by a factor of ``fanout``, so merging a full tier makes a
+        segment of about the next one
+        """
+        tiers: Dict[int, List[Segment]] = {}
+        for segment in segments:
+            tiers.setdefault(int(math.log(max(len(segment), 1), fanout)), []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= fanout:
+                return tiers[tier]
+        return []
+
+    def compact(self, force: bool = False, min_segments: Optional[int] = None) -> bool:
+        """Merge the segments of one size tier into one and swap it in atomically.
+
+        A tier is merged once it holds ``min_segments`` segments (default
+        COMPACTION_MIN_SEGMENTS); larger segments are not touched. The merged
+        segment is built without holding the write lock, so ingestion carries on
+        meanwhile. It gets the approximate index of ``index_config`` if it is large
+        enough. ``force`` instead merges every segment into one, even a single one.
+        Returns whether anything was merged.
+        """
+        min_segments = max(2, min_segments or int(os.getenv('COMPACTION_MIN_SEGMENTS', 8)))
+        with self._compaction_lock:
+            segments = list(self._snapshot.segments) if force else self._size_tier(self._snapshot.segments, min_segments)
+            if not segments:
+                return False
+            # Each segment covers an ascending run of row ids; merging in that order keeps them sorted
+            segments.sort(key=_first_rowid)
+            with self._write_lock:
+                name = f"seg-{self._next_segment:06d}"
+                self._next_segment += 1
+            vectors = np.concatenate([segment.vectors for segment in segments])
+            rowids = np.concatenate([segment.rowids for segment in segments])
+            # Vectors of replaced documents have nothing left to return
+            live = self.docstore.contains(rowids)
+            if not live.all():
+                vectors, rowids = vectors[live], rowids[live]
+            merged = Segment(name, vectors, rowids, self.index_config.build(vectors))
+            if self.path:
+                merged = self._write_segment(merged)
+
+            with self._write_lock:
+                # Writers only ever append, so every merged segment is still in the snapshot
+                merged_names = {segment.name for segment in segments}
+                compacted = sorted([merged, *(
+                    segment for segment in self._snapshot.segments if segment.name not in merged_names
+                )], key=_first_rowid)
+                if self.path:
+                    # Files obsoleted by the previous compaction have had a full cycle
+                    # for other processes that loaded them to finish
+                    self._deletable.update(self._obsolete)
+                    self._obsolete = [segment.name for segment in segments]
+                    self._write_manifest(compacted)
+                self._publish(compacted)
+        logger.info(f"Compacted {len(segments)} segments into {merged.name} ({len(merged)} vectors)")
+        return True
+
+    def rebuild(self, index_config: IndexConfig):
+        """Switch to another index configuration and rebuild the store as one segment"""
+        self.index_config = index_config
+        self.compact(force=True)
+
+    def start_background_compaction(self,
+                                    interval: Optional[float] = None,
+                                    min_segments: Optional[int] = None):
+        """Every ``interval`` seconds, merge each size tier that has gathered ``min_segments`` segments"""
+        interval = interval or float(os.getenv('COMPACTION_INTERVAL_SECONDS', 300))
+
+        def run():
+            while not self._stop_compaction.wait(interval):
+                try:
+                    while self.compact(min_segments=min_segments):
+                        pass
+                except Exception as e:
+                    logger.error(f"Error compacting vector store: {str(e)}")
+
+        if self._compaction_thread is None:
+            self._compaction_thread = threading.Thread(
+                target=run, name="vector-store-compaction", daemon=True
+            )
+            self._compaction_thread.start()
+
+    def stop_background_compaction(self):
+        self._stop_compaction.set()
+
+    # Search
+
+    def similarity_search_with_score_by_vector(self,
+                                               embedding: List[float],
+                                               k: int = 4,
+                                               filter: Optional[Union[Dict, Callable]] = None,
+                                               fetch_k: int = 20,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """
+        Search every segment, merge by L2 distance and fetch documents for the top hits.
+
+        Dict filters on indexed metadata fields are resolved to row ids first and the
+        search runs only over those vectors, so selective filters still return k hits;
+        broad ones are applied to a deeper unfiltered search instead. Other filters
+        are applied to the nearest ``fetch_k`` candidates. Unfiltered searches go
+        deeper while vectors of replaced documents leave them short of k.
+        """
+        query = np.asarray([embedding], dtype=np.float32)
+        with self.snapshot() as snapshot:
+            if isinstance(filter, dict) and self.docstore.is_indexed_filter(filter):
+                if self.docstore.filter_is_broad(filter, BROAD_FILTER_ROWS):
+                    results = self._post_filter_search(query, k, filter, snapshot)
+                    if results is not None:
+                        return results
+                allowed = self.docstore.filter_rowids(filter)
+                return self._search_rowids(query, k, allowed, snapshot.segments)
+
+            depth = max(k, fetch_k) if filter is not None else k
+            while True:
+                candidates = self._search_candidates(query, depth, segments=snapshot.segments)[0]
+                results = self._resolve_candidates(candidates, k, depth, filter)
+                if filter is not None or len(results) >= k or len(candidates) < depth:
+                    return results
+                depth *= 2
+
+    def _post_filter_search(self,
+                            query: np.ndarray,
+                            k: int,
+                            filter: Dict,
+                            snapshot: IndexSnapshot) -> Optional[List[Tuple[Document, float]]]:
+        """
+        Unfiltered search keeping the hits that match ``filter``, deepened a few
+        times; None if the fields combine into a filter too selective for that
+        """
+        # Every field matches at least BROAD_FILTER_ROWS rows, so expect about that share to pass
+        depth = min(snapshot.ntotal, max(k, 2 * k * snapshot.ntotal // BROAD_FILTER_ROWS))
+        for _ in range(3):
+            candidates = self._search_candidates(query, depth, segments=snapshot.segments)[0]
+            results = self._resolve_candidates(candidates, k, depth, filter)
+            if len(results) >= k or len(candidates) < depth:
+                return results
+            depth *= 4
+        return None
+
+    def _resolve_candidates(self,
+                            candidates: List[Tuple[float, int]],
+                            k: int,
+                            page_size: int,
+                            filter: Optional[Union[Dict, Callable]] = None) -> List[Tuple[Document, float]]:
+        """The first ``k`` candidates whose document is still stored and passes ``filter``"""
+        results = []
+        # Read documents a page at a time so unfiltered searches touch only k rows
+        for start in range(0, len(candidates), page_size):
+            page = candidates[start:start + page_size]
+            documents = self.docstore.get(rowid for _, rowid in page)
+            for distance, rowid in page:
+                doc = documents.get(rowid)
+                if doc is None:
+                    continue
+                if filter is not None and not _matches_filter(doc.metadata, filter):
+                    continue
+                results.append((doc, distance))
+                if len(results) >= k:
+                    return results
+        return results
+
+    def _search_candidates(self,
+                           queries: np.ndarray,
+                           depth: int,
+                           exact: bool = False,
+                           segments: Optional[Sequence[Segment]] = None) -> List[List[Tuple[float, int]]]:
+        """Nearest ``depth`` (distance, row id) pairs of each query, merged across segments"""
+        candidates = [[] for _ in range(len(queries))]
+        for segment in segments if segments is not None else self._snapshot.segments:
+            if not len(segment):
+                continue
+            distances, rowids = segment.search(queries, depth, exact)
+            for query_candidates, query_distances, query_rowids in zip(candidates, distances, rowids):
+                query_candidates.extend(
+                    (float(distance), int(rowid))
+                    for distance, rowid in zip(query_distances, query_rowids)
+                    if rowid != -1
+                )
+        for query_candidates in candidates:
+            query_candidates.sort(key=lambda candidate: candidate[0])
+            del query_candidates[depth:]
+        return candidates
+
+    def similarity_search_with_score_by_vectors(self,
+                                                embeddings: List[List[float]],
+                                                k: int = 4,
+                                                exact: bool = False) -> List[List[Tuple[Document, float]]]:
+        """
+        Unfiltered search for a batch of query vectors with one index pass and one
+        docstore read, plus a deeper pass for queries that hit replaced documents
+        """
+        if not len(embeddings):
+            return []
+        queries = np.asarray(embeddings, dtype=np.float32)
+        results: List[List[Tuple[Document, float]]] = [[] for _ in range(len(queries))]
+        pending, depth = list(range(len(queries))), k
+        with self.snapshot() as snapshot:
+            while pending:
+                candidates = self._search_candidates(queries[pending], depth, exact, snapshot.segments)
+                documents = self.docstore.get({rowid for query in candidates for _, rowid in query})
+                short = []
+                for index, query in zip(pending, candidates):
+                    results[index] = [
+                        (documents[rowid], distance) for distance, rowid in query if rowid in documents
+                    ][:k]
+                    if len(results[index]) < k and len(query) == depth:
+                        short.append(index)
+                pending, depth = short, depth * 2
+        return results
+
+    def _search_rowids(self,
+                       query: np.ndarray,
+                       k: int,
+                       allowed: np.ndarray,
+                       segments: Sequence[Segment]) -> List[Tuple[Document, float]]:
+        """Exact search over only the vectors whose row ids are in ``allowed``"""
+        candidates = []
+        for segment in segments:
+            positions = segment.positions(allowed)
+            if not len(positions):
+                continue
+            distances, rowids = segment.search_subset(query, positions, k)
+            candidates.extend(
+                (float(distance), int(rowid))
+                for distance, rowid in zip(distances[0], rowids[0])
+                if rowid != -1
+            )
+        candidates.sort(key=lambda candidate: candidate[0])
+        candidates = candidates[:k]
+        documents = self.docstore.get(rowid for _, rowid in candidates)
+        return [
+            (documents[rowid], distance)
+            for distance, rowid in candidates
+            if rowid in documents
+        ]
+
+    def keyword_search_with_score(self,
+                                  query: str,
+                                  k: int = 4,
+                                  filter: Optional[Union[Dict, Callable]] = None,
+                                  fetch_k: int = 20,
+                                  **kwargs: Any) -> List[Tuple[Document, float]]:
+        """BM25 search over the docstore's lexical index; higher scores are better"""
+        depth = max(k, fetch_k) if filter is not None else k
+        hits = self.docstore.keyword_search(query, depth)
+        documents = self.docstore.get(rowid for rowid, _ in hits)
+        results = []
+        for rowid, score in hits:
+            doc = documents.get(rowid)
+            if doc is None:
+                continue
+            if filter is not None and not _matches_filter(doc.metadata, filter):
+                continue
+            results.append((doc, score))
+            if len(results) >= k:
+                break
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = await self.embedding.aembed_query(query)
+        # FAISS and SQLite release the GIL while searching
+        return await asyncio.to_thread(self.similarity_search_with_score_by_vector, embedding, k, **kwargs)
+
+    async def asimilarity_search_with_score_batch(self,
+                                                  queries: List[str],
+                                                  k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """Search several queries with one embedding batch, one index pass and one docstore read"""
+        if not queries:
+            return []
+        embeddings = await self.embedding.aembed_documents(list(queries))
+        return await asyncio.to_thread(self.similarity_search_with_score_by_vectors, embeddings, k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls,
+                   texts: List[str],
+                   embedding: Embeddings,
+                   metadatas: Optional[List[Dict]] = None,
+                   ids: Optional[List[str]] = None,
+                   path: Optional[str] = None,
+                   **kwargs: Any) -> "SegmentedVectorStore":
+        store = cls(embedding, path)
+        store.add_texts(texts, metadatas, ids)
+        return store
@@ -0,0 +1,116 @@
+"""AsyncFetcher against a local HTTP server"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+from src.http_fetcher import AsyncFetcher, ResponseTooLarge
+
+ETAG = '"v1"'
+MAX_BYTES = 1000
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Request arrival times, for the rate limit test
+    arrivals = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", headers=None, length: bool = True):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if length:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        _Handler.arrivals.append(time.monotonic())
+        if self.path == "/page":
+            self._send(200, b"<html>hello</html>")
+        elif self.path == "/large":
+            self._send(200, b"x" * (MAX_BYTES * 2))
+        elif self.path == "/large-unsized":
+            # No Content-Length: the limit has to be enforced while reading
+            self._send(200, b"x" * (MAX_BYTES * 2), length=False)
+        elif self.path == "/trickle":
+            # Each read is quick, so only a bound on the whole exchange stops it
+            self.send_response(200)
+            self.send_header("Content-Length", "50")
+            self.end_headers()
+            for _ in range(50):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(0.1)
+        elif self.path == "/etag":
+            if self.headers.get("If-None-Match") == ETAG:
+                self._send(304, length=False)
+            else:
+                self._send(200, b"versioned", {"ETag": ETAG})
+        else:
+            self._send(404)
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _fetch(fetcher: AsyncFetcher, *urls: str, headers=None):
+    async def run():
+        try:
+            return await asyncio.gather(*(fetcher.fetch(url, headers) for url in urls))
+        finally:
+            await fetcher.aclose()
+    return asyncio.run(run())
+
+
+def test_fetches_page(server):
+    [page] = _fetch(AsyncFetcher(max_bytes=MAX_BYTES), f"{server}/page")
+    assert page["status"] == 200
+    assert page["text"] == "<html>hello</html>"
+
+
+def test_rejects_declared_size_over_limit(server):
+    with pytest.raises(ResponseTooLarge):
+        _fetch(AsyncFetcher(max_bytes=MAX_BYTES), f"{server}/large")
+
+
+def test_rejects_streamed_size_over_limit(server):
+    with pytest.raises(ResponseTooLarge):
+        _fetch(AsyncFetcher(max_bytes=MAX_BYTES), f"{server}/large-unsized")
+
+
+def test_timeout_bounds_whole_response(server):
+    started = time.monotonic()
+    with pytest.raises((TimeoutError, httpx.TimeoutException)):
+        _fetch(AsyncFetcher(timeout=0.5), f"{server}/trickle")
+    assert time.monotonic() - started < 2
+
+
+def test_per_host_rate_limit(server):
+    _Handler.arrivals.clear()
+    _fetch(AsyncFetcher(per_host_rps=10), *[f"{server}/page"] * 5)
+    gaps = [later - earlier for earlier, later in zip(_Handler.arrivals, _Handler.arrivals[1:])]
+    assert len(gaps) == 4
+    assert min(gaps) >= 0.08
+
+
+def test_not_modified(server):
+    fetcher = AsyncFetcher()
+    [first] = _fetch(fetcher, f"{server}/etag")
+    assert first["status"] == 200
+    assert first["headers"]["etag"] == ETAG
+
+    [second] = _fetch(fetcher, f"{server}/etag", headers={"If-None-Match": ETAG})
+    assert second["status"] == 304
+    assert second["text"] == ""
@@ -0,0 +1,126 @@
+"""LLMGateway coalescing and retries with the local provider"""
+from typing import Any, List, Optional
+import asyncio
+import time
+import httpx
+import pytest
+from langchain_core.messages import BaseMessage, HumanMessage
+from src.llm_gateway import LLMGateway, LocalChatModel
+
+
+class ProviderError(Exception):
+    """Error shaped like the provider SDK's, with a status code and response"""
+
+    def __init__(self, status_code: int, retry_after: Optional[str] = None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": retry_after} if retry_after is not None else {}
+        self.response = httpx.Response(status_code, headers=headers)
+
+
+class FlakyChatModel(LocalChatModel):
+    """LocalChatModel whose first ``failures`` calls raise ``error_status``"""
+
+    failures: int = 0
+    error_status: int = 429
+    retry_after: Optional[str] = None
+    attempts: int = 0
+
+    def _fail(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ProviderError(self.error_status, self.retry_after)
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any):
+        self._fail()
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any):
+        self._fail()
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+def _messages(text: str) -> List[BaseMessage]:
+    return [HumanMessage(content=text)]
+
+
+def test_identical_concurrent_calls_are_coalesced():
+    gateway = LLMGateway(provider="local")
+    chat = gateway.chat_model()
+    chat.model.latency = 0.05
+
+    async def run():
+        return await asyncio.gather(
+            *(chat.ainvoke("same question") for _ in range(5)),
+            chat.ainvoke("another question")
+        )
+
+    replies = asyncio.run(run())
+    assert len({reply.content for reply in replies[:5]}) == 1
+    assert replies[5].content != replies[0].content
+    assert chat.model.calls == 2
+    assert gateway.calls == 2
+    assert gateway.coalesced == 4
+
+
+def test_sequential_calls_are_not_coalesced():
+    gateway = LLMGateway(provider="local")
+    chat = gateway.chat_model()
+
+    async def run():
+        await chat.ainvoke("question")
+        await chat.ainvoke("question")
+
+    asyncio.run(run())
+    assert chat.model.calls == 2
+    assert gateway.coalesced == 0
+
+
+def test_async_retries_rate_limits():
+    gateway = LLMGateway(provider="local", max_retries=3, backoff=0.01)
+    model = FlakyChatModel(failures=2)
+    reply = asyncio.run(gateway.ainvoke("key", model, _messages("hi"), None, {}))
+    assert reply.content.startswith("Local response")
+    assert model.attempts == 3
+    assert gateway.retries == 2
+
+
+def test_blocking_retries_transient_errors():
+    gateway = LLMGateway(provider="local", max_retries=3, backoff=0.01)
+    model = FlakyChatModel(failures=1, error_status=503)
+    gateway.invoke("key", model, _messages("hi"), None, {})
+    assert model.attempts == 2
+    assert gateway.retries == 1
+
+
+def test_honours_retry_after():
+    gateway = LLMGateway(provider="local", max_retries=1, backoff=0.01)
+    model = FlakyChatModel(failures=1, retry_after="0.3")
+    started = time.monotonic()
+    asyncio.run(gateway.ainvoke("key", model, _messages("hi"), None, {}))
+    assert time.monotonic() - started >= 0.3
+
+
+def test_gives_up_after_max_retries():
+    gateway = LLMGateway(provider="local", max_retries=2, backoff=0.01)
+    model = FlakyChatModel(failures=10)
+    with pytest.raises(ProviderError):
+        asyncio.run(gateway.ainvoke("key", model, _messages("hi"), None, {}))
+    assert model.attempts == 3
+
+
+def test_does_not_retry_client_errors():
+    gateway = LLMGateway(provider="local", max_retries=3, backoff=0.01)
+    model = FlakyChatModel(failures=1, error_status=400)
+    with pytest.raises(ProviderError):
+        asyncio.run(gateway.ainvoke("key", model, _messages("hi"), None, {}))
+    assert gateway.retries == 0
+
+
+def test_backoff_is_capped_exponential():
+    gateway = LLMGateway(provider="local", max_retries=10, backoff=0.5, max_backoff=2)
+    error = ProviderError(429)
+    for attempt in range(6):
+        delay = gateway._retry_delay(error, attempt)
+        assert 0 <= delay <= min(0.5 * 2 ** attempt, 2)
+    assert gateway._retry_delay(error, 10) is None